@@ -0,0 +1,167 @@
+import os
+
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from typing import List, Tuple
+
+import sys
+
+WORKING_DIR: str = os.getcwd()
+
+if WORKING_DIR not in sys.path:
+    sys.path.append(WORKING_DIR)
+
+import api.dto
+
+from api.utils import calculate_period
+from database.storage import Storage
+
+
+# Memory budget (in bytes) shared by all the cached windows
+DATA_CACHE_MAX_SIZE: int = 64 * 1024 * 1024
+
+# Upper bound of the incremental reads (values stamped after the end of the window are fetched too)
+MAX_TIMESTAMP: str = '9999-12-31T23:59:59'
+
+
+def estimate_size(data: api.dto.Data) -> int:
+
+    '''Estimates the memory used by a cached value.
+
+    Arguments:
+     - data (api.dto.Data): cached value
+
+    Returns:
+     - 'int' size in bytes
+    '''
+
+    return sys.getsizeof(data) + sys.getsizeof(data.__dict__) + \
+           sum(sys.getsizeof(v) for v in data.__dict__.values())
+
+
+class DataCacheEntry:
+    '''Sliding window of values, ordered by timestamp, of a (name_like, period) query'''
+
+    def __init__(self):
+        self.data: List[api.dto.Data] = []
+        self.timestamps: List[str] = []
+        self.high_water_mark: int = 0
+        self.size: int = 0
+
+    def append(self, data: List[api.dto.Data]):
+
+        '''Adds the new values to the window, keeping it ordered by timestamp.
+
+        Arguments:
+         - data (List[api.dto.Data]): values ordered by timestamp
+
+        Returns: None
+        '''
+
+        if len(data) == 0:
+            return
+
+        late = len(self.timestamps) > 0 and data[0].timestamp < self.timestamps[-1]
+
+        self.data.extend(data)
+        self.size += sum(estimate_size(d) for d in data)
+
+        # Values stored late (with a timestamp older than the last cached one) need a re-sort
+        if late:
+            self.data.sort(key=lambda d: d.timestamp)
+            self.timestamps = [d.timestamp for d in self.data]
+        else:
+            self.timestamps.extend(d.timestamp for d in data)
+
+    def evict(self, start_time: str):
+
+        '''Removes the values which fell out of the window.
+
+        Arguments:
+         - start_time (str): start time of the window
+
+        Returns: None
+        '''
+
+        index = bisect_left(self.timestamps, start_time)
+        if index > 0:
+            self.size -= sum(estimate_size(d) for d in self.data[:index])
+            del self.data[:index]
+            del self.timestamps[:index]
+
+
+class DataCache:
+    '''LRU cache of the results of relative-period (e.g. 'last_1_hour') data queries.
+
+    Every entry holds the previous result of a (name_like, period) query and the
+    storage high-water mark it has seen: polling the same query fetches only the
+    values stored after it, and drops the ones which fell out of the window.
+    '''
+
+    def __init__(self, max_size: int = DATA_CACHE_MAX_SIZE):
+        self.max_size: int = max_size
+        self.size: int = 0
+        self.entries: OrderedDict[Tuple[str, str], DataCacheEntry] = OrderedDict()
+
+    def get_data(self, storage: Storage, name_like: str, period: str) -> List[api.dto.Data]:
+
+        '''Gets the values of the tags in the specified period, reading only the new ones from the storage.
+
+        Arguments:
+         - storage (Storage): storage of the tags' values
+         - name_like (str): pattern of the tags' names (SQL LIKE)
+         - period (str): period of time in format 'last_amount_unit' (already validated)
+
+        Returns:
+         - 'List[api.dto.Data]' in case of success
+        '''
+
+        key = (name_like, period)
+        start_time, end_time = calculate_period(period)
+
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            entry = DataCacheEntry()
+        else:
+            self.size -= entry.size
+
+        # Values with a sequence number greater than the high-water mark are the ones stored after the last call.
+        # They are read without upper time bound: a value stamped after end_time (clock skew, NTP step) is
+        # kept in the window until it falls in the period, otherwise it would never be read again
+        high_water_mark = storage.high_water_mark()
+
+        if high_water_mark > entry.high_water_mark:
+            samples = storage.read_range(start_time, MAX_TIMESTAMP, name_like, 
+                                         after=entry.high_water_mark, upto=high_water_mark)
+
+            entry.append([api.dto.Data(name=sample.name, timestamp=sample.timestamp, value=sample.value,
+                                       quality=sample.quality)
+                          for sample in samples])
+            entry.high_water_mark = high_water_mark
+
+        entry.evict(start_time)
+
+        data = entry.data[:bisect_right(entry.timestamps, end_time)]
+
+        # Least recently used entries are evicted until the cache fits its memory budget
+        if entry.size <= self.max_size:
+            self.entries[key] = entry
+            self.size += entry.size
+
+        while self.size > self.max_size:
+            _, evicted_entry = self.entries.popitem(last=False)
+            self.size -= evicted_entry.size
+
+        return data
+
+    def clear(self):
+
+        '''Removes all the cached entries.
+
+        Arguments: None
+
+        Returns: None
+        '''
+
+        self.entries.clear()
+        self.size = 0
@@ -1,5 +1,7 @@
 from pydantic import BaseModel
 
+from database.models import QUALITY_GOOD
+
 class Tags(BaseModel):
 
     id: int | None = None
@@ -19,5 +21,15 @@ class Data(BaseModel):
 
     name: str    
     timestamp: str
-    value: float
-    
\ No newline at end of file
+    value: float | None
+    quality: int = QUALITY_GOOD
+
+
+class Alarms(BaseModel):
+
+    name: str
+    alarm_type: str
+    setpoint: float
+    start_time: str
+    end_time: str | None = None
+    peak_value: float
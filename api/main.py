@@ -1,10 +1,12 @@
 import os
 import sqlalchemy
 
-from fastapi import FastAPI, HTTPException
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Query
 from sqlalchemy.orm import Session, sessionmaker
 from typing import List
-from fastapi.responses import FileResponse, RedirectResponse
+from fastapi.responses import FileResponse, RedirectResponse, Response
+from starlette.concurrency import run_in_threadpool
 
 import sys
 
@@ -16,13 +18,19 @@ if WORKING_DIR not in sys.path:
 import database.models
 import api.dto
 
-from database.utils import db_connect
-from api.utils import (validate_period, calculate_period, generate_chart, 
+from database.storage import Storage
+from database.utils import db_connect, storage_connect
+from api.cache import DataCache
+from api.utils import (validate_period, validate_timestamps, calculate_period, generate_chart, 
+                       select_charts_series, generate_charts, shutdown_charts_pool, 
+                       CHARTS_MAX_TILES, 
                        API_METADATA, 
                        ROOT_ENDPOINT_METADATA, 
                        GET_TAGS_ENDPOINT_METADATA, POST_TAGS_ENDPOINT_METADATA, 
                        GET_DATA_ENDPOINT_METADATA,
-                       GET_CHART_ENDPOINT_METADATA)
+                       GET_ALARMS_ENDPOINT_METADATA,
+                       GET_CHART_ENDPOINT_METADATA,
+                       GET_CHARTS_ENDPOINT_METADATA)
 from misc.utils import initialize_logger
 
 
@@ -31,15 +39,49 @@ SCRIPT_NAME: str = os.path.split(__file__)[1]
 # Logger initialization
 logger = initialize_logger(SCRIPT_NAME)
     
-# Connection with DB
-db_engine = db_connect(create_metadata=False, echo=False)
-if db_engine is not None:
+# Cache of the relative-period data queries
+data_cache = DataCache()
+
+# Session and storage shared by the endpoints (created by the lifespan hook)
+session: Session | None = None
+storage: Storage | None = None
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+
+    '''Opens the connection with the DB when the server starts and closes it when the server stops.
+
+    Arguments:
+     - app (FastAPI): application instance
+
+    Returns: None
+    '''
+
+    global session, storage
+
+    # Connection with DB: the schema is created and migrated by the collector, not by the (many) API workers,
+    # which would run the same migration concurrently
+    db_engine = db_connect(create_metadata=False, echo=False)
+    if db_engine is None:
+        raise RuntimeError('Connection with DB -> FAILED')
 
     # Create Session
-    Session = sessionmaker(bind=db_engine)
+    session = sessionmaker(bind=db_engine)()
+
+    # Storage of the tags' values
+    storage = storage_connect(session)
+
+    yield
 
-    with Session() as session:     
-        app = FastAPI(**API_METADATA)  
+    storage.close()
+    session.close()
+    data_cache.clear()
+    shutdown_charts_pool()
+    db_engine.dispose()
+
+
+app = FastAPI(lifespan=lifespan, **API_METADATA)
 
 # root endpoint
 @app.get('/', **ROOT_ENDPOINT_METADATA)
@@ -102,35 +144,72 @@ async def get_data(period: str = 'last_1_hour', start_time: str = None, end_time
     data = []
 
     # If the user is not providing any specific time range, then the parameter 'period' is considered   
+    # Relative periods are served by the cache, which reads only the values stored after the previous call
     if start_time is None or end_time is None:
         if validate_period(period):
-            start_time, end_time = calculate_period(period)
+            return data_cache.get_data(storage, name_like, period)
         else:
             raise HTTPException(status_code=422, detail='Invalid period')
+    elif not validate_timestamps(start_time, end_time):
+        raise HTTPException(status_code=422, detail='Invalid time range')
                 
     # Selecting the data
+    samples = storage.read_range(start_time, end_time, name_like)
+    
+    for sample in samples:
+        data.append(api.dto.Data(name=sample.name, timestamp=sample.timestamp, value=sample.value,
+                                 quality=sample.quality))
+
+    return data
+
+
+# GET alarms endpoint
+@app.get('/alarms', **GET_ALARMS_ENDPOINT_METADATA)
+async def get_alarms(period: str = 'last_1_hour', start_time: str = None, end_time: str = None, name_like: str = '%', 
+                     alarm_type: str = '%', active_only: bool = False) -> List[api.dto.Alarms]:
+    
+    # List of values to return
+    alarms = []
+
+    # If the user is not providing any specific time range, then the parameter 'period' is considered   
+    if start_time is None or end_time is None:
+        if validate_period(period):
+            start_time, end_time = calculate_period(period)
+        else:
+            raise HTTPException(status_code=422, detail='Invalid period')
+    elif not validate_timestamps(start_time, end_time):
+        raise HTTPException(status_code=422, detail='Invalid time range')
+    
+    # Selecting the alarm events overlapping the time range (the ones still active have no end_time)
     sql_statement = sqlalchemy.select(
                         database.models.Tags.name,
-                        database.models.Data.timestamp,
-                        database.models.Data.value) \
-                        .join(database.models.Tags, database.models.Data.tag_id == database.models.Tags.id) \
+                        database.models.AlarmEvents.alarm_type,
+                        database.models.AlarmEvents.setpoint,
+                        database.models.AlarmEvents.start_time,
+                        database.models.AlarmEvents.end_time,
+                        database.models.AlarmEvents.peak_value) \
+                        .join(database.models.Tags, database.models.AlarmEvents.tag_id == database.models.Tags.id) \
                         .where(
                             sqlalchemy.and_(
-                                sqlalchemy.between(
-                                    database.models.Data.timestamp, 
-                                    start_time, 
-                                    end_time),
+                                database.models.AlarmEvents.start_time <= end_time,
+                                sqlalchemy.or_(
+                                    database.models.AlarmEvents.end_time.is_(None),
+                                    database.models.AlarmEvents.end_time >= start_time),
+                                database.models.AlarmEvents.alarm_type.like(alarm_type),
                                 database.models.Tags.name.like(name_like)
                             )
                         ) \
-                        .order_by(database.models.Data.timestamp)
-        
-    data_rows = session.execute(sql_statement)
+                        .order_by(database.models.AlarmEvents.start_time)
+    
+    if active_only:
+        sql_statement = sql_statement.where(database.models.AlarmEvents.end_time.is_(None))
     
-    for row in data_rows:
-        data.append(api.dto.Data(name=row.name, timestamp=row.timestamp, value=row.value))
+    alarm_rows = session.execute(sql_statement)
+    
+    for row in alarm_rows:
+        alarms.append(api.dto.Alarms(**row._asdict()))
 
-    return data
+    return alarms
 
 
 # GET chart endpoint
@@ -148,11 +227,54 @@ async def get_chart(tag_name: str = None, period: str = 'last_1_hour', start_tim
                 start_time, end_time = calculate_period(period)
             else:
                 raise HTTPException(status_code=422, detail='Invalid period')
+        elif not validate_timestamps(start_time, end_time):
+            raise HTTPException(status_code=422, detail='Invalid time range')
             
-    file_path = generate_chart(tag_name, start_time, end_time, session)
+    file_path = generate_chart(tag_name, start_time, end_time, session, storage)
     
     # Checking if the user asked for wrong tag name
     if file_path is None:
         raise HTTPException(status_code=422, detail='No tag name found')
             
     return FileResponse(file_path)
+
+
+# GET charts endpoint
+@app.get('/charts', **GET_CHARTS_ENDPOINT_METADATA)
+async def get_charts(tag_names: List[str] = Query(None), name_like: str = None, period: str = 'last_1_hour', 
+                     start_time: str = None, end_time: str = None, output_format: str = 'png'):
+    
+    # Checking if the user set the tag_names or the name_like parameter
+    if not tag_names and name_like is None:
+        raise HTTPException(status_code=422, detail='No tag specified')
+    
+    if output_format not in ('png', 'zip'):
+        raise HTTPException(status_code=422, detail='Invalid output format')
+        
+    # If the user is not providing any specific time range, then the parameter 'period' is considered   
+    if start_time is None or end_time is None:
+        if validate_period(period):
+            start_time, end_time = calculate_period(period)
+        else:
+            raise HTTPException(status_code=422, detail='Invalid period')
+    elif not validate_timestamps(start_time, end_time):
+        raise HTTPException(status_code=422, detail='Invalid time range')
+    
+    series_list = select_charts_series(session, storage, start_time, end_time, tag_names, name_like)
+    
+    # Checking if the user asked for too many tags
+    if series_list is None:
+        raise HTTPException(status_code=422, detail=f'Too many tags (maximum {CHARTS_MAX_TILES})')
+    
+    # Checking if the user asked for wrong tag names
+    if len(series_list) == 0:
+        raise HTTPException(status_code=422, detail='No tag name found')
+    
+    # Charts are rendered by a pool of processes: the event loop only waits for them
+    content = await run_in_threadpool(generate_charts, series_list, start_time, end_time, output_format)
+    
+    if output_format == 'zip':
+        return Response(content, media_type='application/zip', 
+                        headers={'Content-Disposition': 'attachment; filename="charts.zip"'})
+    
+    return Response(content, media_type='image/png')
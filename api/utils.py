@@ -1,10 +1,9 @@
 import datetime
-import matplotlib.pyplot as plt
-import matplotlib.dates
 import os
 import sqlalchemy
+import threading
 
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, Response
 from re import search
 from sqlalchemy.orm import Session
 from typing import List
@@ -19,6 +18,8 @@ if WORKING_DIR not in sys.path:
 import api.dto
 import database.models
 
+from database.storage import Storage
+
 API_METADATA_DESCRIPTION: str = '''#### Industrial Internet of Things REST API for gathering, storing and analysing data from IIoT devices.
 
 ### Introduction
@@ -64,6 +65,13 @@ GET_DATA_ENDPOINT_METADATA: dict = {
     'tags': ['data']
 }
 
+GET_ALARMS_ENDPOINT_METADATA: dict = {
+    'summary': 'GET Alarms', 
+    'description': 'This endpoint lets you interact with the alarm events (SET-HH/H/L/LL excursions) detected by the collector.', 
+    'response_model': List[api.dto.Alarms],
+    'tags': ['alarms']
+}
+
 GET_CHART_ENDPOINT_METADATA: dict = {
     'summary': 'GET Chart', 
     'description': 'This endpoint lets you generate a chart with the specified tag name and period.', 
@@ -71,6 +79,30 @@ GET_CHART_ENDPOINT_METADATA: dict = {
     'tags': ['chart']
 }
 
+GET_CHARTS_ENDPOINT_METADATA: dict = {
+    'summary': 'GET Charts', 
+    'description': 'This endpoint lets you generate the charts of many tags (list of names or name pattern) and the specified period, '
+                   'as a single multi-panel PNG image or as a ZIP archive with a PNG per tag.', 
+    'response_class': Response,
+    'tags': ['chart']
+}
+
+# Colors and labels of the setpoints' lines (HH, H, L, LL)
+SETPOINTS_COLORS: tuple = ('r', 'g', 'c', 'm')
+SETPOINTS_LABELS: tuple = ('Set HH', 'Set H', 'Set L', 'Set LL')
+
+# Batch charts: size of every tile (inches), tiles per row of the multi-panel image and rendering processes
+CHARTS_TILE_SIZE: tuple = (6.4, 3.6)
+CHARTS_PANEL_COLUMNS: int = 5
+CHARTS_WORKERS: int = os.cpu_count() or 1
+
+# Maximum number of tiles (tags) of a batch: every tile is rendered and held in memory before being assembled
+CHARTS_MAX_TILES: int = 50
+
+# Pool of processes rendering the charts (created on first use, by one of the server's threads)
+charts_pool = None
+charts_pool_lock = threading.Lock()
+
 
 def validate_period(period: str) -> bool:
 
@@ -90,6 +122,27 @@ def validate_period(period: str) -> bool:
     return search(PERIOD_PATTERN, period) is not None     
         
 
+def validate_timestamps(*timestamps: str) -> bool:
+
+    '''Validates given timestamps.
+    
+    Arguments:
+      - timestamps (str): timestamps in the format '%Y-%m-%dT%H:%M:%S'
+
+    Returns:
+     - 'True' in case of success
+     - 'False' in case of failure
+    '''
+
+    try:
+        for timestamp in timestamps:
+            datetime.datetime.strptime(timestamp, database.models.TIMESTAMP_FORMAT)
+    except ValueError:
+        return False
+
+    return True
+
+
 def calculate_period(period: str) -> tuple:
 
     '''Calculates start_time and end_time from a given textual period.
@@ -118,7 +171,64 @@ def calculate_period(period: str) -> tuple:
     return start_time, end_time
 
 
-def generate_chart(tag_name: str, start_time: str, end_time: str, session: Session) -> str | None:
+def draw_chart(ax, dates: list, values: list, setpoints: tuple, start_time: str, end_time: str,
+               tag_description: str, tag_low_limit: float, tag_high_limit: float, tag_egu: str):
+
+    '''Draws the trend of a tag, with its setpoints, on the specified axes.
+
+    Arguments:
+     - ax (matplotlib.axes.Axes): axes on which draw the chart
+     - dates (list): timestamps of the values (matplotlib dates)
+     - values (list): values of the tag
+     - setpoints (tuple): values of the setpoints (HH, H, L, LL), None if missing
+     - start_time (str): start time of the data
+     - end_time (str): end time of the data
+     - tag_description (str): description of the tag (chart title)
+     - tag_low_limit (float): low limit of the Y axis
+     - tag_high_limit (float): high limit of the Y axis
+     - tag_egu (str): engineering unit of the tag (Y axis label)
+
+    Returns: None
+    '''
+
+    import matplotlib.dates
+
+    # Calculating the time delta between end_time and start_time
+    time_delta: datetime.timedelta = datetime.datetime.strptime(end_time, '%Y-%m-%dT%H:%M:%S') - \
+                datetime.datetime.strptime(start_time, '%Y-%m-%dT%H:%M:%S')
+
+    timestamp_format = '%H:%M' if time_delta.days > 1 else '%d/%m %H:%M'
+
+    date_formatter = matplotlib.dates.DateFormatter(timestamp_format)
+    major_locator = matplotlib.dates.AutoDateLocator()
+
+    # Plotting the process value data
+    ax.plot(dates, values, label='PV')
+
+    ax.set_title(tag_description).set_fontweight('bold')
+    ax.grid(color='b', linewidth=0.2)
+    ax.set_xlabel('Time')
+    ax.set_ylabel(tag_egu)
+
+    ax.xaxis.set_major_formatter(date_formatter)
+    ax.xaxis.set_major_locator(major_locator)
+
+    # Setting the Y ticks
+    ax.set_ylim([tag_low_limit, tag_high_limit])
+
+    # Getting the start timestamp and end timestamp
+    plot_start_timestamp = dates[0]
+    plot_end_timestamp = dates[-1]
+
+    # Plotting horizontal lines (setpoints)
+    for setpoint, color, label in zip(setpoints, SETPOINTS_COLORS, SETPOINTS_LABELS):
+        if setpoint is not None:
+            ax.hlines(y=setpoint, xmin=plot_start_timestamp, xmax=plot_end_timestamp, colors=color, label=label)
+
+    ax.legend(ncols=3, loc='lower left')
+
+
+def generate_chart(tag_name: str, start_time: str, end_time: str, session: Session, storage: Storage) -> str | None:
     
     '''Generates a chart based on the specified criteria.
 
@@ -127,76 +237,46 @@ def generate_chart(tag_name: str, start_time: str, end_time: str, session: Sessi
      - start_time (str): start time of the data to be retrieved
      - end_time (str): end time of the data to be retrieved
      - session (sqlalchemy.orm.Session): session in which execute the SQL queries
+     - storage (Storage): storage of the tags' values
 
     Returns:
      - 'chart_file_name' in case of success
      - 'None' in case of failure
     '''
 
+    # Matplotlib is imported on first use, so that workers which never serve charts don't load it
+    import matplotlib.pyplot as plt
+    import matplotlib.dates
+
     dates: list = []
     values: list = []
-    setpoints: list = []
+    setpoints: list = [None] * len(SETPOINTS_LABELS)
 
     chart_file_name: str = './api/export.png'
 
     # Obtaining SYSTEM[n]-PROBE[m]
     tag_name_prefix = '-'.join(tag_name.split('-')[0:2])
         
-    sql_statement = sqlalchemy.select(
-                    database.models.Tags.name, 
-                    database.models.Data.timestamp, 
-                    database.models.Data.value) \
-                    .join(database.models.Tags, database.models.Data.tag_id == database.models.Tags.id) \
-                    .where(
-                        sqlalchemy.and_(
-                            database.models.Tags.name.like(tag_name),
-                            sqlalchemy.between(
-                                database.models.Data.timestamp, 
-                                start_time, 
-                                end_time),
-                        )
-                    ) \
-                    .order_by(database.models.Data.timestamp)
-    
-    data = session.execute(sql_statement)
-    
-    # FrozenResult is used in order to freeze the data in the cache to not re-query the database
-    frozen_result = data.freeze()
+    # Missed reads (bad quality) are not drawn
+    samples = [sample for sample in storage.read_range(start_time, end_time, tag_name)
+               if sample.quality == database.models.QUALITY_GOOD]
 
     # Checking if any result has been returned
-    if len(frozen_result.data) == 0:
+    if len(samples) == 0:
         return None
     else:        
 
         # Saving dates and values in two different lists
-        for row in frozen_result.data:
-            dates.append(matplotlib.dates.datestr2num(row.timestamp))
-            values.append(row.value)
+        for sample in samples:
+            dates.append(matplotlib.dates.datestr2num(sample.timestamp))
+            values.append(sample.value)
 
-        # Querying setpoints' values
-        setpoints_filter = f'{tag_name_prefix}-SET%'
-
-        sql_statement = sqlalchemy.select(
-                        database.models.Tags.name, 
-                        database.models.Data.timestamp, 
-                        database.models.Data.value) \
-                        .join(database.models.Tags, database.models.Data.tag_id == database.models.Tags.id) \
-                        .where(
-                            sqlalchemy.and_(
-                                database.models.Tags.name.like(setpoints_filter),
-                                sqlalchemy.between(
-                                    database.models.Data.timestamp, 
-                                    start_time,
-                                    end_time),
-                            )
-                        ) \
-                        .group_by(database.models.Tags.name) \
-                        .order_by(database.models.Tags.id)
-        
-        data = session.execute(sql_statement)
+        # Querying setpoints' latest good values (SYSTEM[n]-PROBE[m]-SET-HH/H/L/LL): a setpoint without
+        # any good value in the time range is not drawn
+        setpoints_names = [f'{tag_name_prefix}-SET-{level}' for level in ('HH', 'H', 'L', 'LL')]
 
-        for row in data:
-            setpoints.append(row.value)
+        for sample in storage.latest_values(start_time, end_time, tag_names=setpoints_names, good_only=True):
+            setpoints[setpoints_names.index(sample.name)] = sample.value
         
         # Querying tag's info
         sql_statement = sqlalchemy.select(
@@ -210,45 +290,14 @@ def generate_chart(tag_name: str, start_time: str, end_time: str, session: Sessi
 
         tag_description, tag_low_limit, tag_high_limit, tag_egu = data        
 
-        # Calculating the time delta between end_time and start_time
-        time_delta: datetime.timedelta = datetime.datetime.strptime(end_time, '%Y-%m-%dT%H:%M:%S') - \
-                    datetime.datetime.strptime(start_time, '%Y-%m-%dT%H:%M:%S')
-
-        timestamp_format = '%H:%M' if time_delta.days > 1 else '%d/%m %H:%M'
-
-        date_formatter = matplotlib.dates.DateFormatter(timestamp_format)
-        major_locator = matplotlib.dates.AutoDateLocator()
-
         # Creating subplots
         fig, ax = plt.subplots(figsize=(12.8, 7.2))
 
-        # Plotting the process value data
-        ax.plot(dates, values, label='PV')
-
-        ax.set_title(tag_description).set_fontweight('bold')
-        ax.grid(color='b', linewidth=0.2)
-        ax.set_xlabel('Time')
-        ax.set_ylabel(tag_egu)
-
-        ax.xaxis.set_major_formatter(date_formatter)
-        ax.xaxis.set_major_locator(major_locator)
-
         # Obtaining setpoints values from tuples (tag_name, value)
         set_hh, set_h, set_l, set_ll = setpoints
 
-        # Setting the Y ticks
-        ax.set_ylim([tag_low_limit, tag_high_limit])
-
-        # Getting the start timestamp and end timestamp
-        plot_start_timestamp = dates[0]
-        plot_end_timestamp = dates[-1]
-
-        # Plotting horizontal lines (setpoints)
-        ax.hlines(y=set_hh, xmin=plot_start_timestamp, xmax=plot_end_timestamp, colors='r', label='Set HH')
-        ax.hlines(y=set_h, xmin=plot_start_timestamp, xmax=plot_end_timestamp, colors='g', label='Set H')
-        ax.hlines(y=set_l, xmin=plot_start_timestamp, xmax=plot_end_timestamp, colors='c', label='Set L')
-        ax.hlines(y=set_ll, xmin=plot_start_timestamp, xmax=plot_end_timestamp, colors='m', label='Set LL')
-        ax.legend(ncols=3, loc='lower left')
+        draw_chart(ax, dates, values, (set_hh, set_h, set_l, set_ll), start_time, end_time,
+                   tag_description, tag_low_limit, tag_high_limit, tag_egu)
 
         # Auto-formatting dates to be displayed correctly
         fig.autofmt_xdate()       
@@ -256,4 +305,212 @@ def generate_chart(tag_name: str, start_time: str, end_time: str, session: Sessi
         plt.savefig(chart_file_name)
 
         return chart_file_name
-    
\ No newline at end of file
+
+
+def select_charts_series(session: Session, storage: Storage, start_time: str, end_time: str, 
+                         tag_names: List[str] | None = None, name_like: str | None = None) -> List[dict]:
+
+    '''Selects the values, setpoints and info of many tags with one range query.
+
+    Arguments:
+     - session (sqlalchemy.orm.Session): session in which execute the SQL queries
+     - storage (Storage): storage of the tags' values
+     - start_time (str): start time of the data to be retrieved
+     - end_time (str): end time of the data to be retrieved
+     - tag_names (List[str]): names of the tags to draw on the charts
+     - name_like (str): pattern of the names of the tags to draw on the charts (SQL LIKE)
+
+    Returns:
+     - 'List[dict]' series (one per tag with data, in the requested order) in case of success
+     - 'None' if more than CHARTS_MAX_TILES tags are selected (their values are not read)
+    '''
+
+    series: dict = {}
+
+    # Querying tags' info
+    tag_filter = database.models.Tags.name.in_(tag_names) if tag_names else database.models.Tags.name.like(name_like)
+
+    sql_statement = sqlalchemy.select(
+                    database.models.Tags.name, 
+                    database.models.Tags.description, 
+                    database.models.Tags.low_limit, 
+                    database.models.Tags.high_limit, 
+                    database.models.Tags.egu) \
+                    .where(sqlalchemy.and_(database.models.Tags.deleted_at.is_(None), tag_filter)) \
+                    .order_by(database.models.Tags.id)
+
+    for row in session.execute(sql_statement):
+        series[row.name] = {'tag_name': row.name,
+                            'tag_description': row.description,
+                            'tag_low_limit': row.low_limit,
+                            'tag_high_limit': row.high_limit,
+                            'tag_egu': row.egu,
+                            'timestamps': [],
+                            'values': [],
+                            'setpoints': [None] * len(SETPOINTS_LABELS)}
+
+    if len(series) == 0:
+        return []
+
+    if len(series) > CHARTS_MAX_TILES:
+        return None
+
+    # Querying the values of all the tags in the time range (missed reads, with bad quality, are not drawn)
+    for sample in storage.read_range(start_time, end_time, tag_names=list(series.keys())):
+        if sample.quality != database.models.QUALITY_GOOD:
+            continue
+
+        series[sample.name]['timestamps'].append(sample.timestamp)
+        series[sample.name]['values'].append(sample.value)
+
+    # Querying the latest good setpoints' values (SYSTEM[n]-PROBE[m]-SET-HH/H/L/LL) of all the tags
+    setpoints_cells: dict = {}
+    for tag_name in series:
+        tag_name_prefix = '-'.join(tag_name.split('-')[0:2])
+        for i, level in enumerate(('HH', 'H', 'L', 'LL')):
+            setpoints_cells.setdefault(f'{tag_name_prefix}-SET-{level}', []).append((tag_name, i))
+
+    for sample in storage.latest_values(start_time, end_time, tag_names=list(setpoints_cells.keys()), good_only=True):
+        for tag_name, i in setpoints_cells[sample.name]:
+            series[tag_name]['setpoints'][i] = sample.value
+
+    # Tags without values in the time range are not drawn
+    series_list = [s for s in series.values() if len(s['values']) > 0]
+    if tag_names:
+        series_list.sort(key=lambda s: tag_names.index(s['tag_name']))
+
+    return series_list
+
+
+def render_chart_tile(series: dict, start_time: str, end_time: str, 
+                      figsize: tuple = CHARTS_TILE_SIZE, as_png: bool = True):
+
+    '''Renders the chart of a single series (executed by the charts' worker processes).
+
+    The object-oriented Matplotlib API is used (no pyplot), so that no global state is shared.
+
+    Arguments:
+     - series (dict): series returned by select_charts_series
+     - start_time (str): start time of the data
+     - end_time (str): end time of the data
+     - figsize (tuple): size of the chart (inches)
+     - as_png (bool): flag to return the PNG file content instead of the RGBA pixels
+
+    Returns:
+     - 'bytes' (PNG) or 'numpy.ndarray' (RGBA pixels) in case of success
+    '''
+
+    import io
+    import matplotlib.dates
+    import numpy as np
+
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=figsize)
+    canvas = FigureCanvasAgg(fig)
+    ax = fig.subplots()
+
+    dates = matplotlib.dates.date2num(np.array(series['timestamps'], dtype='datetime64[s]'))
+
+    draw_chart(ax, dates, series['values'], tuple(series['setpoints']), start_time, end_time,
+               series['tag_description'], series['tag_low_limit'], series['tag_high_limit'], series['tag_egu'])
+
+    # Auto-formatting dates to be displayed correctly
+    fig.autofmt_xdate()
+
+    if as_png:
+        buffer = io.BytesIO()
+        fig.savefig(buffer, format='png')
+        return buffer.getvalue()
+
+    canvas.draw()
+    return np.asarray(canvas.buffer_rgba()).copy()
+
+
+def get_charts_pool():
+
+    '''Gets the pool of processes rendering the charts (created on first use).
+
+    Arguments: None
+
+    Returns:
+     - 'concurrent.futures.ProcessPoolExecutor' in case of success
+    '''
+
+    global charts_pool
+
+    # Requests run in the threadpool: without the lock, concurrent first requests would create a pool each
+    with charts_pool_lock:
+        if charts_pool is None:
+            import multiprocessing
+
+            from concurrent.futures import ProcessPoolExecutor
+
+            # Renderers are spawned: forking the (multi-threaded) server would copy its event loop and
+            # DB connection into every renderer, which only needs the pickled series
+            charts_pool = ProcessPoolExecutor(max_workers=CHARTS_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+
+        return charts_pool
+
+
+def shutdown_charts_pool():
+
+    '''Stops the pool of processes rendering the charts, if it has been created.
+
+    Arguments: None
+
+    Returns: None
+    '''
+
+    global charts_pool
+
+    with charts_pool_lock:
+        if charts_pool is not None:
+            charts_pool.shutdown(cancel_futures=True)
+            charts_pool = None
+
+
+def generate_charts(series_list: List[dict], start_time: str, end_time: str, output_format: str = 'png') -> bytes:
+
+    '''Generates the charts of many series, rendering them in parallel.
+
+    Arguments:
+     - series_list (List[dict]): series returned by select_charts_series
+     - start_time (str): start time of the data
+     - end_time (str): end time of the data
+     - output_format (str): 'png' for a single multi-panel image, 'zip' for an archive with a PNG per tag
+
+    Returns:
+     - 'bytes' content of the PNG or ZIP file in case of success
+    '''
+
+    import io
+    import math
+
+    as_png = output_format == 'zip'
+    tiles = list(get_charts_pool().map(render_chart_tile, series_list, 
+                                       [start_time] * len(series_list), [end_time] * len(series_list),
+                                       [CHARTS_TILE_SIZE] * len(series_list), [as_png] * len(series_list)))
+
+    buffer = io.BytesIO()
+
+    if as_png:
+        import zipfile
+
+        with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_STORED) as archive:
+            for series, tile in zip(series_list, tiles):
+                archive.writestr(f'{series["tag_name"]}.png', tile)
+    else:
+        import matplotlib.image
+        import numpy as np
+
+        # Tiles are stitched on a grid (white padding for the missing ones)
+        columns = min(len(tiles), CHARTS_PANEL_COLUMNS)
+        rows = math.ceil(len(tiles) / columns)
+        tiles += [np.full_like(tiles[0], 255)] * (rows * columns - len(tiles))
+
+        panel = np.concatenate([np.concatenate(tiles[r * columns:(r + 1) * columns], axis=1) for r in range(rows)], axis=0)
+        matplotlib.image.imsave(buffer, panel, format='png')
+
+    return buffer.getvalue()
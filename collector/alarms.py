@@ -0,0 +1,267 @@
+import numpy as np
+import os
+import sqlalchemy
+
+from datetime import datetime
+from sqlalchemy.orm import Session
+from typing import Dict, List, Tuple
+
+import sys
+
+WORKING_DIR: str = os.getcwd()
+
+if WORKING_DIR not in sys.path:
+    sys.path.append(WORKING_DIR)
+
+from database.models import AlarmEvents, Tags, QUALITY_GOOD, TIMESTAMP_FORMAT
+from database.storage import Storage
+
+
+# Alarm levels, in the same order used for the columns of the setpoints matrix
+ALARM_LEVELS: Tuple[str, ...] = ('HH', 'H', 'L', 'LL')
+
+# Number of high alarm levels (HH, H): they are the first columns of the setpoints matrix
+HIGH_ALARM_LEVELS_COUNT: int = 2
+
+# Hysteresis (in EGU) that the PV must cross back before an active alarm is cleared
+ALARM_DEADBAND: float = 0.5
+
+# Time (in seconds) a violation must last before the alarm is raised
+ALARM_ON_DELAY: int = 60
+
+
+def get_tag_prefix(tag_name: str) -> str:
+
+    '''Obtains the SYSTEM[n]-PROBE[m] prefix of the specified tag name.
+
+    Arguments:
+     - tag_name (str): name of the tag
+
+    Returns:
+     - 'str' in case of success
+    '''
+
+    return '-'.join(tag_name.split('-')[0:2])
+
+
+class AlarmEngine:
+    '''Evaluates PV samples against the SET-HH/H/L/LL setpoints of their probe.
+
+    The engine keeps the current setpoints and the alarms' state in memory,
+    one row per PV tag and one column per alarm level, so that every incoming
+    batch is evaluated with a few vectorized comparisons.
+    Only the start and the end of every alarm are written in the alarm_events table.
+    '''
+
+    def __init__(self, deadband: float = ALARM_DEADBAND, on_delay: int = ALARM_ON_DELAY):
+        self.deadband: float = deadband
+        self.on_delay: int = on_delay
+
+        # PV tag id -> row of the state matrices
+        self.pv_rows: Dict[int, int] = {}
+
+        # Setpoint tag id -> (row, column) of the setpoints matrix
+        self.setpoint_cells: Dict[int, Tuple[int, int]] = {}
+
+        # Opened alarm events: (row, column) -> alarm_events.id
+        self.event_ids: Dict[Tuple[int, int], int] = {}
+
+        self.pv_tag_ids: np.ndarray = np.empty(0, dtype=np.int64)
+        self._allocate(0)
+
+    def _allocate(self, rows: int):
+        shape = (rows, len(ALARM_LEVELS))
+
+        self.setpoints: np.ndarray = np.full(shape, np.nan)
+        self.active: np.ndarray = np.zeros(shape, dtype=bool)
+        self.pending_since: np.ndarray = np.full(shape, np.nan)
+        self.peaks: np.ndarray = np.full(shape, np.nan)
+
+    def load(self, session: Session, storage: Storage):
+
+        '''Loads PV tags, their latest setpoints and the alarms still active.
+
+        Arguments:
+         - session (sqlalchemy.orm.Session): session in which execute the SQL queries
+         - storage (Storage): storage of the tags' values
+
+        Returns: None
+        '''
+
+        sql_statement = sqlalchemy.select(Tags.id, Tags.name) \
+                        .where(Tags.deleted_at.is_(None)) \
+                        .order_by(Tags.id)
+
+        tags = session.execute(sql_statement).all()
+
+        pv_tags = [tag for tag in tags if tag.name.endswith('-PV')]
+        pv_rows_by_prefix = {get_tag_prefix(tag.name): row for row, tag in enumerate(pv_tags)}
+
+        self.pv_rows = {tag.id: row for row, tag in enumerate(pv_tags)}
+        self.pv_tag_ids = np.array([tag.id for tag in pv_tags], dtype=np.int64)
+        self.setpoint_cells = {}
+        self.event_ids = {}
+        self._allocate(len(pv_tags))
+
+        setpoint_cells_by_name: dict = {}
+
+        for tag in tags:
+            for column, level in enumerate(ALARM_LEVELS):
+                if tag.name.endswith(f'-SET-{level}'):
+                    row = pv_rows_by_prefix.get(get_tag_prefix(tag.name))
+                    if row is not None:
+                        self.setpoint_cells[tag.id] = (row, column)
+                        setpoint_cells_by_name[tag.name] = (row, column)
+
+        # Latest good value of every setpoint tag (the latest sample could be a missed read, e.g. after an outage)
+        if len(setpoint_cells_by_name) > 0:
+            for sample in storage.latest_values(tag_names=list(setpoint_cells_by_name.keys()), good_only=True):
+                self.setpoints[setpoint_cells_by_name[sample.name]] = sample.value
+
+        # Alarms which have not been closed yet (e.g. collector restarted during an excursion)
+        sql_statement = sqlalchemy.select(AlarmEvents) \
+                        .where(AlarmEvents.end_time.is_(None))
+
+        for event in session.scalars(sql_statement):
+            row = self.pv_rows.get(event.tag_id)
+            if row is None or event.alarm_type not in ALARM_LEVELS:
+                continue
+
+            cell = (row, ALARM_LEVELS.index(event.alarm_type))
+            self.active[cell] = True
+            self.pending_since[cell] = self._to_epoch(event.start_time)
+            self.peaks[cell] = event.peak_value
+            self.event_ids[cell] = event.id
+
+    @staticmethod
+    def _to_epoch(timestamp: str) -> float:
+        return datetime.strptime(timestamp, TIMESTAMP_FORMAT).timestamp()
+
+    @staticmethod
+    def _to_timestamp(epoch: float) -> str:
+        return datetime.fromtimestamp(epoch).strftime(TIMESTAMP_FORMAT)
+
+    def evaluate(self, session: Session, records: List[Dict[str, str | float | int]]) -> int:
+
+        '''Evaluates a batch of samples and writes the resulting alarm events.
+
+        The session is not committed, so that samples and events are stored in the same transaction.
+
+        Arguments:
+         - session (sqlalchemy.orm.Session): session in which execute the SQL queries
+         - records (List[Dict[str, str | float | int]]): samples in the format {'timestamp', 'value', 'tag_id', 'quality'}
+
+        Returns:
+         - 'int' number of alarm events started or ended
+        '''
+
+        events_count: int = 0
+
+        # Step of PV samples evaluated together (at most one sample per tag)
+        step_records: list = []
+        step_rows: set = set()
+
+        # Setpoints change in timestamp order between the steps: a PV sample is evaluated against the
+        # setpoints it had when it was read (setpoints first, when they have the same timestamp)
+        for record in sorted(records, key=lambda record: (record['timestamp'], record['tag_id'] in self.pv_rows)):
+
+            # Missed reads (bad quality) neither change the setpoints nor raise or clear alarms
+            if record['quality'] != QUALITY_GOOD:
+                continue
+
+            cell = self.setpoint_cells.get(record['tag_id'])
+            if cell is not None:
+                if cell[0] in step_rows and record['value'] != self.setpoints[cell]:
+                    events_count += self._evaluate_records(session, step_records)
+                    step_records, step_rows = [], set()
+
+                self.setpoints[cell] = record['value']
+
+            elif record['tag_id'] in self.pv_rows:
+                row = self.pv_rows[record['tag_id']]
+                if row in step_rows:
+                    events_count += self._evaluate_records(session, step_records)
+                    step_records, step_rows = [], set()
+
+                step_records.append(record)
+                step_rows.add(row)
+
+        events_count += self._evaluate_records(session, step_records)
+
+        return events_count
+
+    def _evaluate_records(self, session: Session, records: list) -> int:
+        if len(records) == 0:
+            return 0
+
+        rows = np.array([self.pv_rows[record['tag_id']] for record in records], dtype=np.int64)
+        values = np.array([record['value'] for record in records], dtype=np.float64)
+        epochs = np.array([self._to_epoch(record['timestamp']) for record in records])
+
+        return self._evaluate_step(session, rows, values, epochs)
+
+    def _evaluate_step(self, session: Session, rows: np.ndarray, values: np.ndarray, epochs: np.ndarray) -> int:
+        high = slice(0, HIGH_ALARM_LEVELS_COUNT)
+        low = slice(HIGH_ALARM_LEVELS_COUNT, len(ALARM_LEVELS))
+
+        setpoints = self.setpoints[rows]
+        active = self.active[rows]
+        pending_since = self.pending_since[rows]
+        peaks = self.peaks[rows]
+
+        values = values[:, None]
+        epochs = epochs[:, None]
+
+        # Comparisons against NaN (setpoint not received yet) are always False: an unknown
+        # setpoint neither raises a new alarm nor clears an active one
+        violating = np.empty(setpoints.shape, dtype=bool)
+        violating[:, high] = values >= setpoints[:, high]
+        violating[:, low] = values <= setpoints[:, low]
+
+        clearing = np.empty(setpoints.shape, dtype=bool)
+        clearing[:, high] = values < setpoints[:, high] - self.deadband
+        clearing[:, low] = values > setpoints[:, low] + self.deadband
+
+        # On-delay: a violation becomes an alarm only if it lasts at least on_delay seconds
+        pending_since = np.where(~active & violating & np.isnan(pending_since), epochs, pending_since)
+        pending_since = np.where(~active & ~violating, np.nan, pending_since)
+
+        starting = ~active & violating & (epochs - pending_since >= self.on_delay)
+        ending = active & clearing
+
+        # Peak value reached during the excursion (maximum for high alarms, minimum for low ones)
+        tracking = active | violating
+        peaks[:, high] = np.fmax(peaks[:, high], np.where(tracking[:, high], values, np.nan))
+        peaks[:, low] = np.fmin(peaks[:, low], np.where(tracking[:, low], values, np.nan))
+        peaks = np.where(tracking, peaks, np.nan)
+
+        for index, column in zip(*np.nonzero(starting)):
+            cell = (int(rows[index]), int(column))
+            sql_statement = sqlalchemy.insert(AlarmEvents) \
+                            .values(tag_id=int(self.pv_tag_ids[cell[0]]),
+                                    alarm_type=ALARM_LEVELS[column],
+                                    setpoint=float(setpoints[index, column]),
+                                    start_time=self._to_timestamp(pending_since[index, column]),
+                                    peak_value=float(peaks[index, column])) \
+                            .returning(AlarmEvents.id)
+
+            self.event_ids[cell] = session.execute(sql_statement).scalar_one()
+
+        for index, column in zip(*np.nonzero(ending)):
+            cell = (int(rows[index]), int(column))
+            event_id = self.event_ids.pop(cell, None)
+            if event_id is None:
+                continue
+
+            sql_statement = sqlalchemy.update(AlarmEvents) \
+                            .where(AlarmEvents.id == event_id) \
+                            .values(end_time=self._to_timestamp(float(epochs[index, 0])),
+                                    peak_value=float(peaks[index, column]))
+
+            session.execute(sql_statement)
+
+        self.active[rows] = (active | starting) & ~ending
+        self.pending_since[rows] = np.where(ending, np.nan, pending_since)
+        self.peaks[rows] = np.where(ending, np.nan, peaks)
+
+        return int(starting.sum() + ending.sum())
@@ -1,10 +1,10 @@
+import argparse
 import os
 import schedule
 import sqlalchemy
 
 from sqlalchemy.orm import Session, sessionmaker
 from time import sleep
-from typing import Dict, List
 
 import sys
 
@@ -14,11 +14,13 @@ if WORKING_DIR not in sys.path:
     sys.path.append(WORKING_DIR)
 
 import database.models
-from collector.utils import plc_connect, store_data
-from database.utils import db_connect, load_tags
+from collector.connection import PLCConnection
+from collector.sharded import run_sharded_collector
+from collector.utils import store_data
+from database.utils import db_connect, load_tags, storage_connect
 from misc.utils import initialize_logger
 
-   
+
 # Start application
 PLC_IP_ADDRESS: str = '10.149.23.65'
 PLC_RACK: int = 0
@@ -27,59 +29,64 @@ PLC_PORT: int = 102
 
 SCRIPT_NAME: str = os.path.split(__file__)[1]
 
-# Tags' lists
-tags_one_minute: List[Dict[str, Dict[str, int]]] = []
-tags_five_minutes: List[Dict[str, Dict[str, int]]] = []
-
 # Logger initialization
 logger = initialize_logger(SCRIPT_NAME)
-    
-# Connection with DB
-engine = db_connect(create_metadata=True, echo=False)
-if engine is not None:
-    logger.info('Connection with DB -> OK')
 
-    # Create Session
-    Session = sessionmaker(bind=engine)
 
-    # Connection with PLC
-    client = plc_connect(PLC_IP_ADDRESS, PLC_RACK, PLC_SLOT, PLC_PORT)
-    if client is not None:
+def main():
+
+    # Command line arguments
+    parser = argparse.ArgumentParser(description='IIoT data collector')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='number of acquisition processes (more than one enables the sharded collector)')
+    args = parser.parse_args()
+
+    # Connection with DB
+    engine = db_connect(create_metadata=True, echo=False)
+    if engine is not None:
+        logger.info('Connection with DB -> OK')
+
+        # Create Session
+        Session = sessionmaker(bind=engine)
+
+        # Sharded collector: acquisition processes and a single writer process (the only one using the DB)
+        if args.workers > 1:
+            with Session() as session:
+                tags_one_minute, tags_five_minutes = select_tags(session)
+
+            engine.dispose()
 
-        logger.info('Connection with PLC -> OK')
+            run_sharded_collector(args.workers, tags_one_minute, tags_five_minutes,
+                                  PLC_IP_ADDRESS, PLC_RACK, PLC_SLOT, PLC_PORT, logger)
+            return
+
+        # The alarm engine (NumPy) is needed only by the process writing to the DB
+        from collector.alarms import AlarmEngine
+
+        # Connection with PLC (retried in background if the PLC is not reachable: the reads
+        # are stored with a bad quality until it's reconnected)
+        connection = PLCConnection(PLC_IP_ADDRESS, PLC_RACK, PLC_SLOT, PLC_PORT, logger=logger)
+        connection.open()
 
         # Session initailization (without auto-commit)
         with Session() as session:
 
-            # Selecting tags with one minute collection interval
-            sql_statement = sqlalchemy.select(
-                                database.models.Tags.id, 
-                                database.models.Tags.address) \
-                            .where(sqlalchemy.and_(
-                                database.models.Tags.collection_interval == '1 min',
-                                database.models.Tags.deleted_at.is_(None))) \
-                            .order_by(database.models.Tags.id)
-            
-            tags_one_minute = load_tags(session, sql_statement)
-
-            # Selecting tags with five minutes collection interval
-            sql_statement = sqlalchemy.select(
-                                database.models.Tags.id, 
-                                database.models.Tags.address) \
-                            .where(sqlalchemy.and_(
-                                database.models.Tags.collection_interval == '5 min',
-                                database.models.Tags.deleted_at .is_(None))) \
-                            .order_by(database.models.Tags.id)
-            
-            tags_five_minutes = load_tags(session, sql_statement)
-            
+            tags_one_minute, tags_five_minutes = select_tags(session)
+
+            # Storage of the tags' values
+            storage = storage_connect(session)
+
+            # Alarm engine initialization (PV tags, latest setpoints and active alarms)
+            alarm_engine = AlarmEngine()
+            alarm_engine.load(session, storage)
+
             # Trigger one-time storing data before the scheduling
-            store_data(client, tags_one_minute, session, logger, '1 min')
-            store_data(client, tags_five_minutes, session, logger, '5 min')
-            
+            store_data(connection, tags_five_minutes, session, storage, logger, '5 min', alarm_engine)
+            store_data(connection, tags_one_minute, session, storage, logger, '1 min', alarm_engine)
+
             # Schedulers
-            schedule.every().minute.do(store_data, client, tags_one_minute, session, logger, '1 min')
-            schedule.every(5).minutes.do(store_data, client, tags_five_minutes, session, logger, '5 min')
+            schedule.every().minute.do(store_data, connection, tags_one_minute, session, storage, logger, '1 min', alarm_engine)
+            schedule.every(5).minutes.do(store_data, connection, tags_five_minutes, session, storage, logger, '5 min', alarm_engine)
 
             while 1:
                 try:
@@ -87,5 +94,48 @@ if engine is not None:
                     sleep(0.25)
                 except KeyboardInterrupt:
                     logger.info('Collection stopped by user.')
+                    connection.close()
+                    storage.close()
                     session.close()
                     quit()
+
+
+def select_tags(session: Session) -> tuple:
+
+    '''Selects the tags to be collected, grouped by collection interval.
+
+    Arguments:
+     - session (sqlalchemy.orm.Session): session in which execute the SQL queries
+
+    Returns:
+     - 'tuple(tags_one_minute, tags_five_minutes)' in case of success
+    '''
+
+    # Selecting tags with one minute collection interval
+    sql_statement = sqlalchemy.select(
+                        database.models.Tags.id,
+                        database.models.Tags.address) \
+                    .where(sqlalchemy.and_(
+                        database.models.Tags.collection_interval == '1 min',
+                        database.models.Tags.deleted_at.is_(None))) \
+                    .order_by(database.models.Tags.id)
+
+    tags_one_minute = load_tags(session, sql_statement)
+
+    # Selecting tags with five minutes collection interval
+    sql_statement = sqlalchemy.select(
+                        database.models.Tags.id,
+                        database.models.Tags.address) \
+                    .where(sqlalchemy.and_(
+                        database.models.Tags.collection_interval == '5 min',
+                        database.models.Tags.deleted_at .is_(None))) \
+                    .order_by(database.models.Tags.id)
+
+    tags_five_minutes = load_tags(session, sql_statement)
+
+    return tags_one_minute, tags_five_minutes
+
+
+# The guard is required by multiprocessing, which re-imports this module in the worker processes
+if __name__ == '__main__':
+    main()
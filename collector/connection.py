@@ -0,0 +1,224 @@
+import os
+import threading
+
+from logging import Logger
+from typing import Tuple, TYPE_CHECKING
+
+import sys
+
+WORKING_DIR: str = os.getcwd()
+
+if WORKING_DIR not in sys.path:
+    sys.path.append(WORKING_DIR)
+
+from database.models import QUALITY_GOOD, QUALITY_BAD_COMM_FAILURE, QUALITY_BAD_CONFIG_ERROR, QUALITY_BAD_NOT_CONNECTED
+
+# snap7 is imported on first use
+if TYPE_CHECKING:
+    import snap7
+
+
+# Seconds the PLC is given to answer a ping, send or receive (bounded by the scan budget)
+PLC_TIMEOUT: float = 2.0
+
+# Seconds a scan may last: tags not read yet when it expires are stored with a bad quality
+SCAN_BUDGET: float = 20.0
+
+# Reconnection backoff (in seconds), doubled at every failed attempt up to the maximum
+RECONNECT_BACKOFF_MIN: float = 1.0
+RECONNECT_BACKOFF_MAX: float = 60.0
+
+# snap7 errors of the link (by name, as they differ across versions): after a timeout the answer
+# could still arrive and be taken for the answer of the next read, so the link is reset as well
+LINK_ERRORS: tuple = ('S7ConnectionError', 'S7TimeoutError')
+
+
+class PLCConnection:
+    '''Session with a PLC which survives the loss of the link.
+
+    Reads never wait for a broken link: when the link fails (or the health check finds the
+    socket closed) the connection is marked as down and a background thread reconnects
+    with exponential backoff, while the scans go on recording the missed reads with a bad
+    quality. Every device has its own connection, so scans of the healthy devices keep
+    their cadence while a faulty one recovers.
+    Errors of a single item (e.g. a data block which doesn't exist) only make that read bad.
+    Reads are made by a single thread (the scheduler's).
+    '''
+
+    def __init__(self, plc_ip_address: str, plc_rack: int = 0, plc_slot: int = 0, plc_port: int = 102,
+                 timeout: float = PLC_TIMEOUT, logger: Logger | None = None):
+        self.plc_ip_address: str = plc_ip_address
+        self.plc_rack: int = plc_rack
+        self.plc_slot: int = plc_slot
+        self.plc_port: int = plc_port
+        self.timeout: float = timeout
+        self.logger: Logger | None = logger
+
+        self.client: 'snap7.client.Client | None' = None
+        self.connected: bool = False
+
+        self.stop_event = threading.Event()
+        self.reconnect_thread: threading.Thread | None = None
+
+    def _log(self, level: str, message: str):
+        if self.logger is not None:
+            getattr(self.logger, level)(message)
+
+    def _connect(self) -> bool:
+
+        '''Makes a single connection attempt, bounded by the timeout.
+
+        Arguments: None
+
+        Returns:
+         - 'True' in case of success
+         - 'False' in case of failure
+        '''
+
+        import snap7
+        from snap7.type import Parameter
+
+        client = snap7.client.Client()
+
+        timeout_ms = int(self.timeout * 1000)
+        for parameter in (Parameter.PingTimeout, Parameter.SendTimeout, Parameter.RecvTimeout):
+            client.set_param(parameter, timeout_ms)
+
+        # snap7 raises different exception types across versions (RuntimeError, S7Error) besides socket errors
+        try:
+            client.connect(self.plc_ip_address, self.plc_rack, self.plc_slot, self.plc_port)
+        except Exception as e:
+            self._log('debug', f'Connection with PLC {self.plc_ip_address} -> {e}')
+
+        if not client.get_connected():
+            client.destroy()
+            return False
+
+        self.client = client
+        self.connected = True
+
+        return True
+
+    def _reconnect(self):
+        backoff = RECONNECT_BACKOFF_MIN
+
+        while not self.stop_event.wait(backoff):
+            if self._connect():
+                self._log('info', f'Connection with PLC {self.plc_ip_address} -> OK (reconnected)')
+                return
+
+            backoff = min(backoff * 2, RECONNECT_BACKOFF_MAX)
+            self._log('warning', f'Connection with PLC {self.plc_ip_address} -> FAILED, retrying in {backoff:.0f} s')
+
+    def _start_reconnect(self):
+        if self.reconnect_thread is not None and self.reconnect_thread.is_alive():
+            return
+
+        self.reconnect_thread = threading.Thread(target=self._reconnect, name=f'reconnect-{self.plc_ip_address}',
+                                                 daemon=True)
+        self.reconnect_thread.start()
+
+    def _connection_lost(self, reason: str):
+        self.connected = False
+        self._log('error', f'Connection with PLC {self.plc_ip_address} -> LOST ({reason})')
+
+        try:
+            self.client.disconnect()
+        except Exception:
+            pass
+
+        self._start_reconnect()
+
+    def open(self) -> bool:
+
+        '''Connects with the PLC: in case of failure, the connection is retried in background.
+
+        Arguments: None
+
+        Returns:
+         - 'True' if the PLC is connected
+         - 'False' otherwise (reads return a bad quality until the PLC is reconnected)
+        '''
+
+        if self._connect():
+            self._log('info', f'Connection with PLC {self.plc_ip_address} -> OK')
+            return True
+
+        self._log('error', f'Connection with PLC {self.plc_ip_address} -> FAILED, retrying in background')
+        self._start_reconnect()
+
+        return False
+
+    def is_healthy(self) -> bool:
+
+        '''Checks the state of the connection (socket still open).
+
+        Arguments: None
+
+        Returns:
+         - 'True' if the PLC is connected
+         - 'False' otherwise
+        '''
+
+        if not self.connected:
+            return False
+
+        try:
+            healthy = self.client.get_connected()
+        except Exception:
+            healthy = False
+
+        if not healthy:
+            self._connection_lost('health check failed')
+
+        return healthy
+
+    def db_read(self, db_number: int, start: int, size: int) -> Tuple[bytearray | None, int]:
+
+        '''Reads an area of a data block, without waiting for the PLC if the connection is down.
+
+        Arguments:
+         - db_number (int): number of the data block
+         - start (int): offset of the first byte
+         - size (int): number of bytes
+
+        Returns:
+         - 'tuple(bytearray, QUALITY_GOOD)' in case of success
+         - 'tuple(None, quality)' in case of failure, with the bad quality of the read
+        '''
+
+        if not self.is_healthy():
+            return None, QUALITY_BAD_NOT_CONNECTED
+
+        try:
+            return self.client.db_read(db_number, start, size), QUALITY_GOOD
+        except Exception as e:
+            error = e
+
+        if isinstance(error, OSError) or type(error).__name__ in LINK_ERRORS or not self.client.get_connected():
+            self._connection_lost(str(error))
+            return None, QUALITY_BAD_COMM_FAILURE
+
+        self._log('warning', f'Read of DB{db_number}@{start}->{size} from PLC {self.plc_ip_address} -> {error}')
+        return None, QUALITY_BAD_CONFIG_ERROR
+
+    def close(self):
+
+        '''Stops the reconnection and disconnects from the PLC.
+
+        Arguments: None
+
+        Returns: None
+        '''
+
+        self.stop_event.set()
+        if self.reconnect_thread is not None:
+            self.reconnect_thread.join()
+
+        if self.client is not None:
+            try:
+                self.client.disconnect()
+            except Exception:
+                pass
+
+        self.connected = False
@@ -0,0 +1,323 @@
+import multiprocessing
+import os
+import queue
+import schedule
+import signal
+
+from logging import Logger
+from multiprocessing.synchronize import Event
+from sqlalchemy.orm import sessionmaker
+from time import monotonic, sleep
+from typing import Dict, List
+
+import sys
+
+WORKING_DIR: str = os.getcwd()
+
+if WORKING_DIR not in sys.path:
+    sys.path.append(WORKING_DIR)
+
+from collector.connection import PLCConnection
+from collector.utils import read_data_from_plc, write_data
+from database.utils import db_connect, storage_connect
+from misc.utils import initialize_logger
+
+
+SCRIPT_NAME: str = os.path.split(__file__)[1]
+
+# Maximum number of batches waiting to be written (workers block when the writer is behind)
+BATCHES_QUEUE_SIZE: int = 1000
+
+# Maximum number of queued batches the writer merges in a single transaction
+WRITER_MAX_MERGED_BATCHES: int = 100
+
+# Seconds a worker waits for room in the queue before dropping a batch
+WORKER_PUT_TIMEOUT: float = 5.0
+
+# Restart backoff (in seconds) of crashed processes, doubled at every crash up to the maximum
+RESTART_BACKOFF_MIN: float = 1.0
+RESTART_BACKOFF_MAX: float = 60.0
+
+# Seconds a process must stay alive before its restart backoff is reset
+RESTART_BACKOFF_RESET: float = 60.0
+
+# Seconds given to the processes to stop before being terminated (and then killed)
+SHUTDOWN_TIMEOUT: float = 10.0
+
+
+def shard_tags(tags: List[Dict[str, Dict[str, int]]], shards_count: int) -> List[List[Dict[str, Dict[str, int]]]]:
+
+    '''Splits the tags in the specified number of shards (round-robin).
+
+    Arguments:
+     - tags (List[Dict[str, Dict[str, int]]]): list of tags (dictionaries)
+     - shards_count (int): number of shards
+
+    Returns:
+     - 'List[List[Dict[str, Dict[str, int]]]]' in case of success
+    '''
+
+    return [tags[i::shards_count] for i in range(shards_count)]
+
+
+def acquisition_worker(worker_id: int, tags_one_minute: List[Dict[str, Dict[str, int]]],
+                       tags_five_minutes: List[Dict[str, Dict[str, int]]],
+                       plc_ip_address: str, plc_rack: int, plc_slot: int, plc_port: int,
+                       batches: multiprocessing.Queue, stop_event: Event):
+
+    '''Reads its shard of tags from the PLC and sends the batches to the writer process.
+
+    Arguments:
+     - worker_id (int): index of the worker (and of its shard)
+     - tags_one_minute (List[Dict[str, Dict[str, int]]]): tags with one minute collection interval
+     - tags_five_minutes (List[Dict[str, Dict[str, int]]]): tags with five minutes collection interval
+     - plc_ip_address (str): IP address of the PLC
+     - plc_rack (int): rack number where the PLC is located
+     - plc_slot (int): slot number where the PLC is located
+     - plc_port (int): port number used to connect to the PLC
+     - batches (multiprocessing.Queue): channel towards the writer process
+     - stop_event (multiprocessing.synchronize.Event): event set by the supervisor to stop the worker
+
+    Returns: None
+    '''
+
+    # Ctrl+C is handled by the supervisor, which stops the worker through stop_event.
+    # SIGTERM gets back its default action (the forked process inherits the supervisor's handler),
+    # so that terminate() kills a worker which doesn't stop
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+    logger = initialize_logger(f'{SCRIPT_NAME}[worker-{worker_id}]')
+
+    # A worker is not restarted when the PLC is not reachable: its connection is retried in
+    # background and the reads are sent to the writer with a bad quality in the meantime
+    connection = PLCConnection(plc_ip_address, plc_rack, plc_slot, plc_port, logger=logger)
+    connection.open()
+
+    logger.info(f'Collection started ({len(tags_one_minute) + len(tags_five_minutes)} tags)')
+
+    def collect(tags: List[Dict[str, Dict[str, int]]], tags_collection_interval: str):
+        if len(tags) == 0:
+            return
+
+        try:
+            batches.put((tags_collection_interval, read_data_from_plc(connection, tags)), timeout=WORKER_PUT_TIMEOUT)
+        except queue.Full:
+            logger.error(f'collect ({tags_collection_interval}) -> writer queue full, batch dropped')
+
+    # Every worker has its own scheduler (jobs are not shared between processes)
+    scheduler = schedule.Scheduler()
+
+    # Trigger one-time collection before the scheduling
+    collect(tags_five_minutes, '5 min')
+    collect(tags_one_minute, '1 min')
+
+    scheduler.every().minute.do(collect, tags_one_minute, '1 min')
+    scheduler.every(5).minutes.do(collect, tags_five_minutes, '5 min')
+
+    while not stop_event.is_set():
+        scheduler.run_pending()
+        stop_event.wait(0.25)
+
+    connection.close()
+    logger.info('Collection stopped.')
+
+
+def database_writer(batches: multiprocessing.Queue):
+
+    '''Owns the only connection to the database (and storage) and writes the batches sent by the workers.
+
+    Queued batches are merged and written in a single transaction.
+    The writer stops when it receives None (sent by the supervisor after the workers stopped).
+
+    Arguments:
+     - batches (multiprocessing.Queue): channel from the worker processes
+
+    Returns: None
+    '''
+
+    from collector.alarms import AlarmEngine
+
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+    logger = initialize_logger(f'{SCRIPT_NAME}[writer]')
+
+    engine = db_connect(create_metadata=True, echo=False)
+    if engine is None:
+        logger.error('Connection with DB -> FAILED')
+        sys.exit(1)
+
+    Session = sessionmaker(bind=engine)
+
+    with Session() as session:
+
+        storage = storage_connect(session)
+
+        alarm_engine = AlarmEngine()
+        alarm_engine.load(session, storage)
+
+        running: bool = True
+
+        while running:
+            batch = batches.get()
+            if batch is None:
+                break
+
+            tags_collection_intervals: set = set()
+            data: list = []
+            merged_batches: int = 0
+
+            # Merging the batches already waiting in the queue
+            while True:
+                tags_collection_interval, batch_data = batch
+                tags_collection_intervals.add(tags_collection_interval)
+                data.extend(batch_data)
+                merged_batches += 1
+
+                if merged_batches >= WRITER_MAX_MERGED_BATCHES:
+                    break
+
+                try:
+                    batch = batches.get_nowait()
+                except queue.Empty:
+                    break
+
+                if batch is None:
+                    running = False
+                    break
+
+            write_data(data, session, storage, logger, ', '.join(sorted(tags_collection_intervals)), alarm_engine)
+
+        storage.close()
+
+    engine.dispose()
+    logger.info('Writer stopped.')
+
+
+class SupervisedProcess:
+    '''Process restarted by the supervisor, with exponential backoff, every time it exits unexpectedly'''
+
+    def __init__(self, name: str, target, args: tuple):
+        self.name: str = name
+        self.target = target
+        self.args: tuple = args
+        self.process: multiprocessing.Process | None = None
+        self.started_at: float = 0.0
+        self.restart_at: float | None = None
+        self.backoff: float = RESTART_BACKOFF_MIN
+
+    def start(self):
+        self.process = multiprocessing.Process(name=self.name, target=self.target, args=self.args)
+        self.process.start()
+        self.started_at = monotonic()
+        self.restart_at = None
+
+    def supervise(self, logger: Logger):
+
+        '''Restarts the process if it died and its backoff time elapsed.
+
+        Arguments:
+         - logger (logging.Logger): logger of the supervisor
+
+        Returns: None
+        '''
+
+        if self.process.is_alive():
+            if monotonic() - self.started_at > RESTART_BACKOFF_RESET:
+                self.backoff = RESTART_BACKOFF_MIN
+            return
+
+        if self.restart_at is None:
+            self.restart_at = monotonic() + self.backoff
+            logger.error(f'{self.name} exited with code {self.process.exitcode}, '
+                         f'restarting in {self.backoff:.0f} s')
+            self.backoff = min(self.backoff * 2, RESTART_BACKOFF_MAX)
+        elif monotonic() >= self.restart_at:
+            logger.info(f'{self.name} restarted')
+            self.start()
+
+    def stop(self, timeout: float = SHUTDOWN_TIMEOUT):
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join(timeout)
+
+        # e.g. a worker blocked flushing its queue towards a dead writer
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+
+
+def run_sharded_collector(workers_count: int, tags_one_minute: List[Dict[str, Dict[str, int]]],
+                          tags_five_minutes: List[Dict[str, Dict[str, int]]],
+                          plc_ip_address: str, plc_rack: int, plc_slot: int, plc_port: int,
+                          logger: Logger):
+
+    '''Runs the collection with the tags sharded across worker processes and a single writer process.
+
+    Every worker opens its own connection with the PLC, reads and decodes its shard of tags
+    and sends the batches to the writer, which is the only process connected to the database.
+    The supervisor restarts the processes which exit unexpectedly and stops all of them on
+    Ctrl+C (SIGINT) or SIGTERM.
+
+    Arguments:
+     - workers_count (int): number of acquisition worker processes
+     - tags_one_minute (List[Dict[str, Dict[str, int]]]): tags with one minute collection interval
+     - tags_five_minutes (List[Dict[str, Dict[str, int]]]): tags with five minutes collection interval
+     - plc_ip_address (str): IP address of the PLC
+     - plc_rack (int): rack number where the PLC is located
+     - plc_slot (int): slot number where the PLC is located
+     - plc_port (int): port number used to connect to the PLC
+     - logger (logging.Logger): logger of the supervisor
+
+    Returns: None
+    '''
+
+    batches = multiprocessing.Queue(maxsize=BATCHES_QUEUE_SIZE)
+    stop_event = multiprocessing.Event()
+
+    # The signal handler only sets a flag: setting stop_event from it could deadlock
+    # with the supervisor waiting on the same event
+    stop_requested: list = []
+
+    def stop(signal_number, frame):
+        stop_requested.append(signal_number)
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    writer = SupervisedProcess('writer', database_writer, (batches,))
+
+    workers = [SupervisedProcess(f'worker-{i}', acquisition_worker,
+                                 (i, shard_one_minute, shard_five_minutes,
+                                  plc_ip_address, plc_rack, plc_slot, plc_port,
+                                  batches, stop_event))
+               for i, (shard_one_minute, shard_five_minutes) in enumerate(zip(
+                   shard_tags(tags_one_minute, workers_count),
+                   shard_tags(tags_five_minutes, workers_count)))]
+
+    writer.start()
+    for worker in workers:
+        worker.start()
+
+    logger.info(f'Collection started ({workers_count} workers)')
+
+    while len(stop_requested) == 0:
+        writer.supervise(logger)
+        for worker in workers:
+            worker.supervise(logger)
+
+        sleep(1)
+
+    logger.info('Collection stopped by user.')
+    stop_event.set()
+
+    # Workers are stopped first, then the writer drains the queue and receives the sentinel
+    for worker in workers:
+        if worker.process.is_alive():
+            worker.stop()
+
+    if writer.process.is_alive():
+        batches.put(None)
+        writer.stop()
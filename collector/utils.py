@@ -1,12 +1,10 @@
 import os
-import snap7
 
 from datetime import datetime
 from logging import Logger
-from snap7.util import get_real
-from sqlalchemy import insert
 from sqlalchemy.orm import Session
-from typing import List, Dict, Union
+from time import monotonic
+from typing import List, Dict, TYPE_CHECKING
 
 import sys
 
@@ -15,84 +13,117 @@ WORKING_DIR: str = os.getcwd()
 if WORKING_DIR not in sys.path:
     sys.path.append(WORKING_DIR)
 
-from database.models import Data
+from collector.connection import PLCConnection, SCAN_BUDGET
+from database.models import QUALITY_GOOD, QUALITY_BAD_COMM_FAILURE
+from database.storage import Storage
 
-def plc_connect(plc_ip_address: str, plc_rack: int = 0, 
-                plc_slot: int = 0, plc_port: int = 102) -> snap7.client.Client | None:
+# snap7 and the alarm engine (NumPy) are imported on first use
+if TYPE_CHECKING:
+    from collector.alarms import AlarmEngine
+
+def read_data_from_plc(connection: PLCConnection, tags: Dict[str, Dict[str, str]],
+                       scan_budget: float = SCAN_BUDGET) -> List[tuple]:
     
-    '''Connects with the specified PLC.
+    '''Reads data from specified PLC.
+
+    Missed reads (PLC not connected, failed read, scan budget expired) are returned with a
+    bad quality and no value (None).
     
     Arguments:
-     - plc_ip_address (str): IP address of the PLC
-     - plc_rack (int): rack number where the PLC is located
-     - plc_slot (int): slot number where the PLC is located
-     - plc_port (int): port number used to connect to the PLC
+     - connection (PLCConnection): connection with the PLC
+     - tags (Dict[str, Dict[str, str]]): dictionary of tags (dictionaries)
+     - scan_budget (float): seconds the scan may last
 
     Returns:
-     - 'snap7.client.Client' in case of success
-     - 'None' in case of failure
+     - 'List[tuple]' values in the format (timestamp, value, tag_id, quality) in case of success
     '''
     
-    client = snap7.client.Client()
-    client.connect(plc_ip_address, plc_rack, plc_slot, plc_port)
+    from snap7.util import get_real
 
-    return client if client.get_connected() else None
+    data: List[tuple] = []
+    deadline = monotonic() + scan_budget
+    
+    for tag in tags:
+        for tag_id, tag_fields in tag.items():
+            timestamp = datetime.now().strftime('%Y-%m-%dT%H:%M:%S')
 
+            if monotonic() < deadline:
+                buffer, quality = connection.db_read(**tag_fields)
+            else:
+                buffer, quality = None, QUALITY_BAD_COMM_FAILURE
 
-def read_data_from_plc(client: snap7.client.Client, tags: Dict[str, Dict[str, str]]) -> List[tuple]:
+            value = round(get_real(buffer, 0), 2) if quality == QUALITY_GOOD else None
+
+            data.append((timestamp, value, tag_id, quality))
+
+    return data
+
+
+def store_data(connection: PLCConnection, tags: Dict[str, Dict[str, int]], 
+               session: Session, storage: Storage, logger: Logger, tags_collection_interval: str = '', 
+               alarm_engine: 'AlarmEngine | None' = None) -> bool:
     
-    '''Reads data from specified PLC.
+    '''Store data into the database.
     
     Arguments:
-     - client (snap7.client.Client): client instance of the connected PLC
+     - connection (PLCConnection): connection with the PLC
      - tags (Dict[str, Dict[str, str]]): dictionary of tags (dictionaries)
+     - session (sqlalchemy.orm.Session): session used to commit transactions to db
+     - storage (Storage): storage of the tags' values
+     - tags_collection_interval (str): collection interval of the tags passed to the function
+     - alarm_engine (AlarmEngine): engine used to evaluate the collected data against the setpoints
 
     Returns:
-     - 'List[tuple]' in case of success
+     - 'bool' in case of success
     '''
     
-    data: List[Dict[str, Union[str, float]]] = []
     
-    for tag in tags:
-        for tag_id, tag_fields in tag.items():
-            timestamp = datetime.now().strftime('%Y-%m-%dT%H:%M:%S')
-            value = round(get_real(client.db_read(**tag_fields), 0), 2)
-            data.append((timestamp, value, tag_id))
+    data = read_data_from_plc(connection, tags)
 
-    return data
+    return write_data(data, session, storage, logger, tags_collection_interval, alarm_engine)
 
 
-def store_data(client: snap7.client.Client, tags: Dict[str, Dict[str, int]], 
-               session: Session, logger: Logger, tags_collection_interval: str = '') -> bool:
+def write_data(data: List[tuple], session: Session, storage: Storage, logger: Logger, 
+               tags_collection_interval: str = '', alarm_engine: 'AlarmEngine | None' = None) -> bool:
     
-    '''Store data into the database.
+    '''Writes data already read from the PLC into the storage.
     
     Arguments:
-     - client (snap7.client.Client): client instance of the connected PLC
-     - tags (Dict[str, Dict[str, str]]): dictionary of tags (dictionaries)
+     - data (List[tuple]): values in the format (timestamp, value, tag_id, quality)
      - session (sqlalchemy.orm.Session): session used to commit transactions to db
+     - storage (Storage): storage of the tags' values
      - tags_collection_interval (str): collection interval of the tags passed to the function
+     - alarm_engine (AlarmEngine): engine used to evaluate the collected data against the setpoints
 
     Returns:
      - 'bool' in case of success
     '''
     
-    
-    data = read_data_from_plc(client, tags)
     records: list = []
     
     for record in data:
-        timestamp, value, tag_id = record
+        timestamp, value, tag_id, quality = record
         records.append({'timestamp': timestamp, 
                         'value': value, 
-                        'tag_id': tag_id})
+                        'tag_id': tag_id,
+                        'quality': quality})
 
-    sql_statement = insert(Data).values(records).returning(Data.id)
-    
-    inserted_rows = session.execute(sql_statement).all()
-    if inserted_rows[-1].id > 0:
+    if storage.append_samples(data) > 0:
+
+        # Alarm events are committed with the data which generated them
+        if alarm_engine is not None:
+            events_count = alarm_engine.evaluate(session, records)
+            if events_count > 0:
+                logger.warning(f'store_data ({tags_collection_interval}) -> {events_count} alarm event(s)')
+
+        storage.commit()
         session.commit()
-        logger.info(f'store_data ({tags_collection_interval}) -> OK')
+
+        bad_samples_count = sum(1 for record in records if record['quality'] != QUALITY_GOOD)
+        if bad_samples_count > 0:
+            logger.warning(f'store_data ({tags_collection_interval}) -> {bad_samples_count} sample(s) with bad quality')
+        else:
+            logger.info(f'store_data ({tags_collection_interval}) -> OK')
         return True
     
     return False
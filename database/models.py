@@ -1,11 +1,17 @@
 from datetime import datetime
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
-from sqlalchemy import ForeignKey, String
+from sqlalchemy import ForeignKey, Index, String
 from typing import List
 
 
 TIMESTAMP_FORMAT: str = '%Y-%m-%dT%H:%M:%S'
 
+# Quality of the samples (OPC DA codes): missed reads are stored with a bad quality and no value (NULL)
+QUALITY_GOOD: int = 192
+QUALITY_BAD_CONFIG_ERROR: int = 4
+QUALITY_BAD_NOT_CONNECTED: int = 8
+QUALITY_BAD_COMM_FAILURE: int = 24
+
 def utcnow(format: str):
     '''Returns the UTC datetime in string format with custom timestamp format
     
@@ -43,6 +49,23 @@ class Data(Base):
 
     id: Mapped[int] = mapped_column(primary_key=True, nullable=False)
     timestamp: Mapped[str] = mapped_column(nullable=False)
-    value: Mapped[float] = mapped_column(nullable=False)
+    value: Mapped[float | None] = mapped_column(nullable=True)
     tag_id: Mapped[int] = mapped_column(ForeignKey('tags.id'))
-    
\ No newline at end of file
+    quality: Mapped[int] = mapped_column(nullable=False, default=QUALITY_GOOD, server_default=str(QUALITY_GOOD))
+
+
+class AlarmEvents(Base):
+    '''Alarm events table for SQLAlchemy'''
+    __tablename__ = 'alarm_events'
+    __table_args__ = (
+        Index('ix_alarm_events_tag_id_start_time', 'tag_id', 'start_time'),
+        Index('ix_alarm_events_start_time_end_time', 'start_time', 'end_time'),
+    )
+
+    id: Mapped[int] = mapped_column(primary_key=True, nullable=False)
+    tag_id: Mapped[int] = mapped_column(ForeignKey('tags.id'), nullable=False)
+    alarm_type: Mapped[str] = mapped_column(String(2), nullable=False)
+    setpoint: Mapped[float] = mapped_column(nullable=False)
+    start_time: Mapped[str] = mapped_column(nullable=False)
+    end_time: Mapped[str] = mapped_column(nullable=True)
+    peak_value: Mapped[float] = mapped_column(nullable=False)
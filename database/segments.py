@@ -0,0 +1,482 @@
+import mmap
+import numpy as np
+import os
+import re
+import sqlalchemy
+import struct
+import zlib
+
+from sqlalchemy.orm import Session
+from typing import Dict, List, Tuple
+
+from database.models import Tags, QUALITY_GOOD
+from database.storage import AGGREGATE_FUNCTIONS, Sample, Storage, tags_filter
+
+
+# Samples appended to the head file of a tag before it is sealed in a compressed segment
+SEGMENT_MAX_SAMPLES: int = 10080
+
+# Compression level of the segments' blocks (zlib)
+SEGMENT_COMPRESSION_LEVEL: int = 6
+
+# Segment file: header followed by the compressed blocks of sequence numbers, timestamps, values and qualities
+SEGMENT_MAGIC: bytes = b'IIOT'
+SEGMENT_HEADER_FORMAT: str = '<4sIIIII'
+SEGMENT_FILE_PATTERN: str = r'^(?P<min_timestamp>-?\d+)_(?P<max_timestamp>-?\d+)_(?P<first_seq>\d+)_(?P<last_seq>\d+)\.seg$'
+
+# Head file: uncompressed records appended by the writer
+HEAD_FILE_PATTERN: str = r'^head_(?P<first_seq>\d+)\.bin$'
+HEAD_RECORD_DTYPE = np.dtype([('seq', '<i8'), ('timestamp', '<i8'), ('value', '<f8'), ('quality', '<i8')])
+
+# File holding the sequence number of the last committed sample
+SEQUENCE_FILE_NAME: str = 'sequence.bin'
+
+
+def shuffle_bytes(words: np.ndarray) -> bytes:
+    # Byte planes of 64-bit words: the (mostly zero) high bytes end up next to each other
+    return words.view(np.uint8).reshape(-1, 8).T.tobytes()
+
+
+def unshuffle_bytes(data: bytes) -> np.ndarray:
+    return np.frombuffer(data, dtype=np.uint8).reshape(8, -1).T.copy().view('<u8').ravel()
+
+
+def encode_integers(values: np.ndarray) -> bytes:
+
+    '''Encodes integers (timestamps, sequence numbers, qualities) as zig-zag delta-of-delta, byte-shuffled and compressed.
+
+    Arguments:
+     - values (numpy.ndarray): int64 values
+
+    Returns:
+     - 'bytes' in case of success
+    '''
+
+    deltas = np.diff(values, prepend=np.int64(0))
+    delta_of_deltas = np.diff(deltas, prepend=np.int64(0))
+    zigzag = (delta_of_deltas << 1) ^ (delta_of_deltas >> 63)
+
+    return zlib.compress(shuffle_bytes(zigzag.astype('<i8')), SEGMENT_COMPRESSION_LEVEL)
+
+
+def decode_integers(data: bytes) -> np.ndarray:
+
+    '''Decodes integers encoded by encode_integers.
+
+    Arguments:
+     - data (bytes): encoded block
+
+    Returns:
+     - 'numpy.ndarray' int64 values in case of success
+    '''
+
+    zigzag = unshuffle_bytes(zlib.decompress(data))
+    delta_of_deltas = (zigzag >> np.uint64(1)).astype(np.int64) ^ -(zigzag & np.uint64(1)).astype(np.int64)
+
+    return np.cumsum(np.cumsum(delta_of_deltas))
+
+
+def encode_floats(values: np.ndarray) -> bytes:
+
+    '''Encodes floats XOR-ing every value with the previous one (Gorilla), byte-shuffled and compressed.
+
+    Arguments:
+     - values (numpy.ndarray): float64 values
+
+    Returns:
+     - 'bytes' in case of success
+    '''
+
+    bits = values.astype('<f8').view('<u8')
+    xors = bits ^ np.concatenate((np.zeros(1, dtype='<u8'), bits[:-1]))
+
+    return zlib.compress(shuffle_bytes(xors), SEGMENT_COMPRESSION_LEVEL)
+
+
+def decode_floats(data: bytes) -> np.ndarray:
+
+    '''Decodes floats encoded by encode_floats.
+
+    Arguments:
+     - data (bytes): encoded block
+
+    Returns:
+     - 'numpy.ndarray' float64 values in case of success
+    '''
+
+    return np.bitwise_xor.accumulate(unshuffle_bytes(zlib.decompress(data))).view('<f8')
+
+
+def to_epoch(timestamps) -> np.ndarray:
+    # Timestamps are stored as seconds, without any time zone conversion
+    return np.array(timestamps, dtype='datetime64[s]').astype(np.int64)
+
+
+def to_timestamps(epochs: np.ndarray) -> List[str]:
+    return np.datetime_as_string(epochs.astype('datetime64[s]')).tolist()
+
+
+def to_floats(values) -> np.ndarray:
+    # Missing values (None, e.g. missed reads of tags never read) are stored as NaN, which SQLite stores as NULL
+    return np.array(values, dtype=np.float64)
+
+
+def to_values(floats: np.ndarray) -> List[float | None]:
+    return [None if missing else value for value, missing in zip(floats.tolist(), np.isnan(floats).tolist())]
+
+
+class SegmentStorage(Storage):
+    '''Columnar storage of the samples in compressed, per-tag segment files.
+
+    Every tag has a directory with an uncompressed head file, where the writer appends
+    the new samples, and the sealed segments: sequence numbers, timestamps and qualities
+    are encoded as delta-of-delta, values are XOR-ed with the previous one (Gorilla),
+    then the blocks are byte-shuffled and compressed.
+    Segment files are named after their time range and memory-mapped for reads, so
+    only the segments overlapping the requested range are read.
+    A single process (the collector's writer) appends samples, any number of processes can read them.
+    '''
+
+    def __init__(self, session: Session, directory: str):
+        self.session: Session = session
+        self.directory: str = directory
+
+        # Writer state (initialized on the first append)
+        self.heads: Dict[int, Tuple[str, object, int]] | None = None
+        self.last_seq: int = 0
+
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _tag_directory(self, tag_id: int) -> str:
+        return os.path.join(self.directory, str(tag_id))
+
+    def _list_files(self, tag_id: int) -> Tuple[list, list]:
+        segments: list = []
+        heads: list = []
+
+        tag_directory = self._tag_directory(tag_id)
+        if not os.path.isdir(tag_directory):
+            return segments, heads
+
+        for file_name in os.listdir(tag_directory):
+            match = re.search(SEGMENT_FILE_PATTERN, file_name)
+            if match is not None:
+                segments.append((int(match['min_timestamp']), int(match['max_timestamp']),
+                                 int(match['first_seq']), int(match['last_seq']),
+                                 os.path.join(tag_directory, file_name)))
+                continue
+
+            match = re.search(HEAD_FILE_PATTERN, file_name)
+            if match is not None:
+                heads.append((int(match['first_seq']), os.path.join(tag_directory, file_name)))
+
+        return sorted(segments), sorted(heads)
+
+    @staticmethod
+    def _read_head(file_path: str) -> np.ndarray:
+        try:
+            with open(file_path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return np.empty(0, dtype=HEAD_RECORD_DTYPE)
+
+        # A record being written by the writer is ignored
+        records_count = len(data) // HEAD_RECORD_DTYPE.itemsize
+        return np.frombuffer(data, dtype=HEAD_RECORD_DTYPE, count=records_count)
+
+    @staticmethod
+    def _read_segment(file_path: str) -> np.ndarray:
+        with open(file_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as segment:
+            magic, count, seq_length, timestamp_length, value_length, quality_length = \
+                struct.unpack_from(SEGMENT_HEADER_FORMAT, segment)
+            if magic != SEGMENT_MAGIC:
+                raise ValueError(f'Invalid segment file: {file_path}')
+
+            offset = struct.calcsize(SEGMENT_HEADER_FORMAT)
+            records = np.empty(count, dtype=HEAD_RECORD_DTYPE)
+
+            records['seq'] = decode_integers(segment[offset:offset + seq_length])
+            offset += seq_length
+            records['timestamp'] = decode_integers(segment[offset:offset + timestamp_length])
+            offset += timestamp_length
+            records['value'] = decode_floats(segment[offset:offset + value_length])
+            offset += value_length
+            records['quality'] = decode_integers(segment[offset:offset + quality_length])
+
+        return records
+
+    def _read_tag(self, tag_id: int, start: int | None = None, end: int | None = None, latest_only: bool = False,
+                  after: int | None = None, upto: int | None = None, good_only: bool = False) -> np.ndarray:
+
+        # Head files are read before listing the segments: a head sealed in the meantime is then
+        # read twice, but never missed (duplicates are removed by sequence number)
+        _, heads = self._list_files(tag_id)
+        parts = [self._read_head(file_path) for _, file_path in heads]
+        segments, _ = self._list_files(tag_id)
+
+        if latest_only:
+            # Segments are read newest first, until a sample to return (a good one, if good_only) is found
+            for segment in sorted(segments, key=lambda s: s[1], reverse=True):
+                if any(np.any(self._filter(part, upto=upto, good_only=good_only)) for part in parts):
+                    break
+                parts.append(self._read_segment(segment[4]))
+        else:
+            # Segments outside the time range or the sequence numbers range (e.g. already read by
+            # an incremental reader) are skipped without being decoded
+            for min_timestamp, max_timestamp, first_seq, last_seq, file_path in segments:
+                if (start is None or max_timestamp >= start) and (end is None or min_timestamp <= end) and \
+                   (after is None or last_seq > after) and (upto is None or first_seq <= upto):
+                    parts.append(self._read_segment(file_path))
+
+        if len(parts) == 0:
+            return np.empty(0, dtype=HEAD_RECORD_DTYPE)
+
+        records = np.concatenate(parts)
+        _, indexes = np.unique(records['seq'], return_index=True)
+        records = records[indexes]
+
+        return records[self._filter(records, start, end, after, upto, good_only)]
+
+    @staticmethod
+    def _filter(records: np.ndarray, start: int | None = None, end: int | None = None, after: int | None = None,
+                upto: int | None = None, good_only: bool = False) -> np.ndarray:
+        mask = np.ones(len(records), dtype=bool)
+        if start is not None:
+            mask &= records['timestamp'] >= start
+        if end is not None:
+            mask &= records['timestamp'] <= end
+        if after is not None:
+            mask &= records['seq'] > after
+        if upto is not None:
+            mask &= records['seq'] <= upto
+        if good_only:
+            mask &= records['quality'] == QUALITY_GOOD
+
+        return mask
+
+    def _select_tags(self, name_like: str = '%', tag_names: List[str] | None = None) -> list:
+        sql_statement = sqlalchemy.select(Tags.id, Tags.name) \
+                        .where(tags_filter(name_like, tag_names)) \
+                        .order_by(Tags.id)
+
+        return self.session.execute(sql_statement).all()
+
+    def _read_tags(self, tags: list, start: int | None = None, end: int | None = None,
+                   after: int | None = None, upto: int | None = None) -> Tuple[np.ndarray, np.ndarray]:
+
+        # Samples of all the tags, ordered by timestamp, with the index of their tag
+        parts: list = []
+        tag_indexes: list = []
+
+        for i, tag in enumerate(tags):
+            records = self._read_tag(tag.id, start, end, after=after, upto=upto)
+
+            parts.append(records)
+            tag_indexes.append(np.full(len(records), i, dtype=np.int64))
+
+        if len(parts) == 0:
+            return np.empty(0, dtype=HEAD_RECORD_DTYPE), np.empty(0, dtype=np.int64)
+
+        records = np.concatenate(parts)
+        tag_indexes = np.concatenate(tag_indexes)
+        order = np.argsort(records['timestamp'], kind='stable')
+
+        return records[order], tag_indexes[order]
+
+    def _open_writer(self):
+        self.heads = {}
+        self.last_seq = 0
+
+        for directory_name in os.listdir(self.directory):
+            if not directory_name.isdigit():
+                continue
+
+            tag_id = int(directory_name)
+            segments, heads = self._list_files(tag_id)
+            sealed_seq = max((segment[3] for segment in segments), default=0)
+            self.last_seq = max(self.last_seq, sealed_seq)
+
+            for _, file_path in heads:
+                records = self._read_head(file_path)
+
+                # Heads already sealed in a segment (e.g. the writer stopped before deleting them)
+                if len(records) == 0 or records['seq'].max() <= sealed_seq:
+                    os.remove(file_path)
+                    continue
+
+                # Truncating a record partially written
+                with open(file_path, 'r+b') as f:
+                    f.truncate(len(records) * HEAD_RECORD_DTYPE.itemsize)
+
+                self.last_seq = max(self.last_seq, int(records['seq'].max()))
+                self.heads[tag_id] = (file_path, open(file_path, 'ab'), len(records))
+
+    def _seal(self, tag_id: int):
+        file_path, head, _ = self.heads.pop(tag_id)
+        head.close()
+
+        records = self._read_head(file_path)
+
+        seq_block = encode_integers(records['seq'])
+        timestamp_block = encode_integers(records['timestamp'])
+        value_block = encode_floats(records['value'])
+        quality_block = encode_integers(records['quality'])
+
+        segment_name = f'{records["timestamp"].min()}_{records["timestamp"].max()}_' \
+                       f'{records["seq"].min()}_{records["seq"].max()}.seg'
+        segment_path = os.path.join(self._tag_directory(tag_id), segment_name)
+
+        # The segment is written with a temporary name, so that readers never see it partially written
+        with open(f'{segment_path}.tmp', 'wb') as f:
+            f.write(struct.pack(SEGMENT_HEADER_FORMAT, SEGMENT_MAGIC, len(records),
+                                len(seq_block), len(timestamp_block), len(value_block), len(quality_block)))
+            f.write(seq_block)
+            f.write(timestamp_block)
+            f.write(value_block)
+            f.write(quality_block)
+
+        os.replace(f'{segment_path}.tmp', segment_path)
+
+        # A head still opened by a reader (Windows) is removed when the writer restarts
+        try:
+            os.remove(file_path)
+        except OSError:
+            pass
+
+    def append_samples(self, samples: List[tuple]) -> int:
+        if self.heads is None:
+            self._open_writer()
+
+        if len(samples) == 0:
+            return 0
+
+        timestamps, values, tag_ids, qualities = zip(*samples)
+
+        records = np.empty(len(samples), dtype=HEAD_RECORD_DTYPE)
+        records['seq'] = np.arange(self.last_seq + 1, self.last_seq + 1 + len(samples))
+        records['timestamp'] = to_epoch(timestamps)
+        records['value'] = to_floats(values)
+        records['quality'] = qualities
+        tag_ids = np.array(tag_ids, dtype=np.int64)
+
+        self.last_seq += len(samples)
+
+        for tag_id in np.unique(tag_ids).tolist():
+            tag_records = records[tag_ids == tag_id]
+
+            if tag_id not in self.heads:
+                os.makedirs(self._tag_directory(tag_id), exist_ok=True)
+                file_path = os.path.join(self._tag_directory(tag_id), f'head_{tag_records["seq"][0]}.bin')
+                self.heads[tag_id] = (file_path, open(file_path, 'ab'), 0)
+
+            file_path, head, count = self.heads[tag_id]
+            head.write(tag_records.tobytes())
+            self.heads[tag_id] = (file_path, head, count + len(tag_records))
+
+        return len(samples)
+
+    def commit(self):
+        if self.heads is None:
+            return
+
+        for tag_id, (_, head, count) in list(self.heads.items()):
+            head.flush()
+            if count >= SEGMENT_MAX_SAMPLES:
+                self._seal(tag_id)
+
+        # Readers don't read samples after this sequence number (8 bytes, overwritten in place)
+        fd = os.open(os.path.join(self.directory, SEQUENCE_FILE_NAME), os.O_WRONLY | os.O_CREAT | getattr(os, 'O_BINARY', 0))
+        try:
+            os.write(fd, struct.pack('<q', self.last_seq))
+        finally:
+            os.close(fd)
+
+    def high_water_mark(self) -> int:
+        try:
+            with open(os.path.join(self.directory, SEQUENCE_FILE_NAME), 'rb') as f:
+                data = f.read(8)
+        except FileNotFoundError:
+            return 0
+
+        return struct.unpack('<q', data)[0] if len(data) == 8 else 0
+
+    def read_range(self, start_time: str, end_time: str, name_like: str = '%', tag_names: List[str] | None = None,
+                   after: int | None = None, upto: int | None = None) -> List[Sample]:
+
+        tags = self._select_tags(name_like, tag_names)
+
+        # Samples appended but not committed yet are not visible
+        upto = self.high_water_mark() if upto is None else upto
+
+        records, tag_indexes = self._read_tags(tags, int(to_epoch(start_time)), int(to_epoch(end_time)), after, upto)
+
+        names = [tag.name for tag in tags]
+
+        return [Sample(names[i], timestamp, value, quality) for i, timestamp, value, quality in
+                zip(tag_indexes.tolist(), to_timestamps(records['timestamp']), to_values(records['value']),
+                    records['quality'].tolist())]
+
+    def latest_values(self, start_time: str | None = None, end_time: str | None = None, name_like: str = '%',
+                      tag_names: List[str] | None = None, good_only: bool = False) -> List[Sample]:
+
+        samples: list = []
+
+        start = None if start_time is None else int(to_epoch(start_time))
+        end = None if end_time is None else int(to_epoch(end_time))
+        upto = self.high_water_mark()
+
+        for tag in self._select_tags(name_like, tag_names):
+            records = self._read_tag(tag.id, start, end, latest_only=start is None and end is None, upto=upto,
+                                     good_only=good_only)
+            if len(records) > 0:
+                latest = records[[np.argmax(records['timestamp'])]]
+                samples.append(Sample(tag.name, to_timestamps(latest['timestamp'])[0], to_values(latest['value'])[0],
+                                      int(latest['quality'][0])))
+
+        return samples
+
+    def aggregate(self, start_time: str, end_time: str, bucket: int, function: str = 'avg',
+                  name_like: str = '%', tag_names: List[str] | None = None) -> List[Sample]:
+
+        if function not in AGGREGATE_FUNCTIONS:
+            raise ValueError(f'Invalid aggregate function: {function}')
+
+        tags = self._select_tags(name_like, tag_names)
+        records, tag_indexes = self._read_tags(tags, int(to_epoch(start_time)), int(to_epoch(end_time)),
+                                               upto=self.high_water_mark())
+
+        good = records['quality'] == QUALITY_GOOD
+        records, tag_indexes = records[good], tag_indexes[good]
+
+        if len(records) == 0:
+            return []
+
+        # Grouping by (bucket, tag): groups are ordered by bucket start and tag id
+        buckets = records['timestamp'] // bucket * bucket
+        order = np.lexsort((tag_indexes, buckets))
+        buckets, tag_indexes, values = buckets[order], tag_indexes[order], records['value'][order]
+
+        group_starts = np.flatnonzero(np.concatenate(([True], (np.diff(buckets) != 0) | (np.diff(tag_indexes) != 0))))
+        counts = np.diff(np.append(group_starts, len(values)))
+
+        if function == 'count':
+            aggregates = counts.astype(np.float64)
+        elif function == 'min':
+            aggregates = np.minimum.reduceat(values, group_starts)
+        elif function == 'max':
+            aggregates = np.maximum.reduceat(values, group_starts)
+        else:
+            aggregates = np.add.reduceat(values, group_starts)
+            if function == 'avg':
+                aggregates = aggregates / counts
+
+        names = [tag.name for tag in tags]
+
+        return [Sample(names[i], timestamp, value) for i, timestamp, value in
+                zip(tag_indexes[group_starts].tolist(), to_timestamps(buckets[group_starts]), aggregates.tolist())]
+
+    def close(self):
+        if self.heads is not None:
+            for _, head, _ in self.heads.values():
+                head.close()
+            self.heads = None
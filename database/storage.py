@@ -0,0 +1,247 @@
+import sqlalchemy
+
+from abc import ABC, abstractmethod
+from sqlalchemy.orm import Session
+from typing import List, NamedTuple
+
+from database.models import Data, Tags, QUALITY_GOOD
+
+
+# Aggregate functions supported by Storage.aggregate
+AGGREGATE_FUNCTIONS: tuple = ('avg', 'min', 'max', 'sum', 'count')
+
+
+class Sample(NamedTuple):
+    '''Value of a tag at a given timestamp (None for the missed reads of tags never read)'''
+    name: str
+    timestamp: str
+    value: float | None
+    quality: int = QUALITY_GOOD
+
+
+class Storage(ABC):
+    '''Storage of the tags' values (samples).
+
+    Tags and alarm events are always stored in the SQLite DB: a storage only
+    holds the samples, identified by the id of their tag.
+    Every sample gets an increasing sequence number when it is appended, so that
+    readers can ask for the samples stored after a given high-water mark.
+    '''
+
+    @abstractmethod
+    def append_samples(self, samples: List[tuple]) -> int:
+
+        '''Appends samples to the storage (visible to the readers after commit).
+
+        Arguments:
+         - samples (List[tuple]): values in the format (timestamp, value, tag_id, quality)
+
+        Returns:
+         - 'int' number of appended samples
+        '''
+
+    @abstractmethod
+    def commit(self):
+
+        '''Makes the appended samples visible to the readers.
+
+        Arguments: None
+
+        Returns: None
+        '''
+
+    @abstractmethod
+    def high_water_mark(self) -> int:
+
+        '''Gets the sequence number of the last committed sample.
+
+        Arguments: None
+
+        Returns:
+         - 'int' sequence number (0 if the storage is empty)
+        '''
+
+    @abstractmethod
+    def read_range(self, start_time: str, end_time: str, name_like: str = '%', tag_names: List[str] | None = None,
+                   after: int | None = None, upto: int | None = None) -> List[Sample]:
+
+        '''Reads the samples in the specified time range, ordered by timestamp.
+
+        Arguments:
+         - start_time (str): start time of the data to be retrieved
+         - end_time (str): end time of the data to be retrieved
+         - name_like (str): pattern of the tags' names (SQL LIKE), used if tag_names is not specified
+         - tag_names (List[str]): names of the tags
+         - after (int): if specified, only the samples with a greater sequence number are read
+         - upto (int): if specified, only the samples with a lower or equal sequence number are read
+
+        Returns:
+         - 'List[Sample]' in case of success
+        '''
+
+    @abstractmethod
+    def latest_values(self, start_time: str | None = None, end_time: str | None = None, name_like: str = '%',
+                      tag_names: List[str] | None = None, good_only: bool = False) -> List[Sample]:
+
+        '''Reads the latest sample of every tag (in the time range, if specified), ordered by tag id.
+
+        Arguments:
+         - start_time (str): start time of the data to be retrieved
+         - end_time (str): end time of the data to be retrieved
+         - name_like (str): pattern of the tags' names (SQL LIKE), used if tag_names is not specified
+         - tag_names (List[str]): names of the tags
+         - good_only (bool): if True, the latest sample with a good quality (missed reads are skipped)
+
+        Returns:
+         - 'List[Sample]' in case of success
+        '''
+
+    @abstractmethod
+    def aggregate(self, start_time: str, end_time: str, bucket: int, function: str = 'avg',
+                  name_like: str = '%', tag_names: List[str] | None = None) -> List[Sample]:
+
+        '''Aggregates the good-quality samples in the time range in buckets of the specified duration.
+
+        Arguments:
+         - start_time (str): start time of the data to be retrieved
+         - end_time (str): end time of the data to be retrieved
+         - bucket (int): duration of the buckets (seconds)
+         - function (str): aggregate function (avg, min, max, sum, count)
+         - name_like (str): pattern of the tags' names (SQL LIKE), used if tag_names is not specified
+         - tag_names (List[str]): names of the tags
+
+        Returns:
+         - 'List[Sample]' (one per tag and bucket, timestamp is the start of the bucket) in case of success
+        '''
+
+    def close(self):
+
+        '''Releases the resources of the storage.
+
+        Arguments: None
+
+        Returns: None
+        '''
+
+
+def tags_filter(name_like: str = '%', tag_names: List[str] | None = None) -> sqlalchemy.ColumnElement:
+
+    '''Builds the WHERE condition on the tags' names.
+
+    Arguments:
+     - name_like (str): pattern of the tags' names (SQL LIKE), used if tag_names is not specified
+     - tag_names (List[str]): names of the tags
+
+    Returns:
+     - 'sqlalchemy.ColumnElement' in case of success
+    '''
+
+    return Tags.name.in_(tag_names) if tag_names else Tags.name.like(name_like)
+
+
+class SQLiteStorage(Storage):
+    '''Samples stored in the data table of the SQLite DB (the sequence number is data.id).
+
+    Samples are written in the given session: they are committed together with the
+    other changes of the session (e.g. alarm events).
+    '''
+
+    def __init__(self, session: Session):
+        self.session: Session = session
+
+    def append_samples(self, samples: List[tuple]) -> int:
+        if len(samples) == 0:
+            return 0
+
+        records = [{'timestamp': timestamp, 'value': value, 'tag_id': tag_id, 'quality': quality}
+                   for timestamp, value, tag_id, quality in samples]
+
+        sql_statement = sqlalchemy.insert(Data).values(records).returning(Data.id)
+
+        return len(self.session.execute(sql_statement).all())
+
+    def commit(self):
+        self.session.commit()
+
+    def high_water_mark(self) -> int:
+        return self.session.scalar(sqlalchemy.select(sqlalchemy.func.max(Data.id))) or 0
+
+    def read_range(self, start_time: str, end_time: str, name_like: str = '%', tag_names: List[str] | None = None,
+                   after: int | None = None, upto: int | None = None) -> List[Sample]:
+
+        sql_statement = sqlalchemy.select(
+                            Tags.name,
+                            Data.timestamp,
+                            Data.value,
+                            Data.quality) \
+                            .join(Tags, Data.tag_id == Tags.id) \
+                            .where(
+                                sqlalchemy.and_(
+                                    sqlalchemy.between(
+                                        Data.timestamp,
+                                        start_time,
+                                        end_time),
+                                    tags_filter(name_like, tag_names)
+                                )
+                            ) \
+                            .order_by(Data.timestamp)
+
+        if after is not None:
+            sql_statement = sql_statement.where(Data.id > after)
+        if upto is not None:
+            sql_statement = sql_statement.where(Data.id <= upto)
+
+        return [Sample(*row) for row in self.session.execute(sql_statement)]
+
+    def latest_values(self, start_time: str | None = None, end_time: str | None = None, name_like: str = '%',
+                      tag_names: List[str] | None = None, good_only: bool = False) -> List[Sample]:
+
+        # SQLite returns the columns of the row with the MAX() timestamp of every group
+        sql_statement = sqlalchemy.select(
+                            Tags.name,
+                            Data.value,
+                            Data.quality,
+                            sqlalchemy.func.max(Data.timestamp).label('timestamp')) \
+                            .join(Tags, Data.tag_id == Tags.id) \
+                            .where(tags_filter(name_like, tag_names)) \
+                            .group_by(Tags.name) \
+                            .order_by(Tags.id)
+
+        if start_time is not None:
+            sql_statement = sql_statement.where(Data.timestamp >= start_time)
+        if end_time is not None:
+            sql_statement = sql_statement.where(Data.timestamp <= end_time)
+        if good_only:
+            sql_statement = sql_statement.where(Data.quality == QUALITY_GOOD)
+
+        return [Sample(row.name, row.timestamp, row.value, row.quality) for row in self.session.execute(sql_statement)]
+
+    def aggregate(self, start_time: str, end_time: str, bucket: int, function: str = 'avg',
+                  name_like: str = '%', tag_names: List[str] | None = None) -> List[Sample]:
+
+        if function not in AGGREGATE_FUNCTIONS:
+            raise ValueError(f'Invalid aggregate function: {function}')
+
+        # Start of the bucket (seconds), converted back to the timestamp format of the data table
+        bucket_start = sqlalchemy.cast(sqlalchemy.func.strftime('%s', Data.timestamp), sqlalchemy.Integer) // bucket * bucket
+        bucket_timestamp = sqlalchemy.func.strftime('%Y-%m-%dT%H:%M:%S', bucket_start, 'unixepoch')
+
+        sql_statement = sqlalchemy.select(
+                            Tags.name,
+                            bucket_timestamp.label('timestamp'),
+                            getattr(sqlalchemy.func, function)(Data.value).label('value')) \
+                            .join(Tags, Data.tag_id == Tags.id) \
+                            .where(
+                                sqlalchemy.and_(
+                                    sqlalchemy.between(
+                                        Data.timestamp,
+                                        start_time,
+                                        end_time),
+                                    tags_filter(name_like, tag_names),
+                                    Data.quality == QUALITY_GOOD
+                                )
+                            ) \
+                            .group_by(Tags.name, bucket_start) \
+                            .order_by(bucket_start, Tags.id)
+
+        return [Sample(*row) for row in self.session.execute(sql_statement)]
@@ -1,6 +1,8 @@
+import os
 import sqlalchemy
 
 from database.models import Base
+from database.storage import Storage, SQLiteStorage
 from re import findall
 from sqlalchemy.orm import Session
 from typing import List, Dict
@@ -11,6 +13,10 @@ DB_API: str = 'pysqlite'
 DB_RELATIVE_FILE_PATH: str = 'database/data.db'
 DB_CONNECTION_STRING: str = f'{DB_TYPE}+{DB_API}:///{DB_RELATIVE_FILE_PATH}'
 
+# Storage of the tags' values: 'sqlite' (data table) or 'segments' (compressed columnar files)
+STORAGE_BACKEND: str = os.environ.get('IIOT_STORAGE_BACKEND', 'sqlite')
+SEGMENTS_RELATIVE_DIRECTORY: str = 'database/segments'
+
 
 def db_connect(create_metadata: bool = False, echo: bool = False) -> sqlalchemy.Engine | None:    
 
@@ -29,10 +35,98 @@ def db_connect(create_metadata: bool = False, echo: bool = False) -> sqlalchemy.
     engine: sqlalchemy.Engine = sqlalchemy.create_engine(DB_CONNECTION_STRING, echo=echo)
     if create_metadata:
         Base.metadata.create_all(bind=engine)
+        add_missing_columns(engine)
+        rebuild_nullable_tables(engine)
 
     return engine if isinstance(engine, sqlalchemy.Engine) else None
 
 
+def add_missing_columns(engine: sqlalchemy.Engine):
+
+    '''Adds the columns of the models missing in the tables of an existing DB (create_all only creates tables).
+
+    Arguments:
+     - engine (sqlalchemy.Engine): engine connected to the DB
+
+    Returns: None
+    '''
+
+    inspector = sqlalchemy.inspect(engine)
+
+    for table in Base.metadata.sorted_tables:
+        existing_columns = {column['name'] for column in inspector.get_columns(table.name)}
+
+        # New columns must have a server default, which fills the existing rows
+        for column in table.columns:
+            if column.name not in existing_columns:
+                column_definition = sqlalchemy.schema.CreateColumn(column).compile(dialect=engine.dialect)
+
+                # Another process connected to the DB (e.g. a migration script) could add the column in the meantime
+                try:
+                    with engine.begin() as connection:
+                        connection.execute(sqlalchemy.text(f'ALTER TABLE {table.name} ADD COLUMN {column_definition}'))
+                except sqlalchemy.exc.OperationalError as e:
+                    if 'duplicate column name' not in str(e):
+                        raise
+
+
+def rebuild_nullable_tables(engine: sqlalchemy.Engine):
+
+    '''Rebuilds the tables of an existing DB with NOT NULL columns which are nullable in the models (e.g. data.value).
+
+    SQLite can't change the constraints of a column: the table is created again and its rows are copied.
+
+    Arguments:
+     - engine (sqlalchemy.Engine): engine connected to the DB
+
+    Returns: None
+    '''
+
+    inspector = sqlalchemy.inspect(engine)
+
+    with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            existing_columns = {column['name']: column for column in inspector.get_columns(table.name)}
+
+            if not any(column.nullable and not existing_columns[column.name]['nullable'] for column in table.columns):
+                continue
+
+            # Index names are unique in the whole DB: the indexes of the old table are dropped before creating the new ones
+            for index in inspector.get_indexes(table.name):
+                connection.execute(sqlalchemy.text(f'DROP INDEX {index["name"]}'))
+
+            column_names = ', '.join(column.name for column in table.columns)
+
+            connection.execute(sqlalchemy.text(f'ALTER TABLE {table.name} RENAME TO {table.name}_old'))
+            table.create(bind=connection)
+            connection.execute(sqlalchemy.text(f'INSERT INTO {table.name} ({column_names}) '
+                                               f'SELECT {column_names} FROM {table.name}_old'))
+            connection.execute(sqlalchemy.text(f'DROP TABLE {table.name}_old'))
+
+
+def storage_connect(session: Session, backend: str = STORAGE_BACKEND) -> Storage:
+
+    '''Connects to the storage of the tags' values.
+    
+    Arguments:
+     - session (sqlalchemy.orm.Session): session used to read the tags (and to store the values, for SQLite)
+     - backend (str): 'sqlite' or 'segments'
+
+    Returns:
+     - 'Storage' in case of success
+    '''
+
+    if backend == 'sqlite':
+        return SQLiteStorage(session)
+    
+    if backend == 'segments':
+        # NumPy is loaded only when the columnar storage is used
+        from database.segments import SegmentStorage
+        return SegmentStorage(session, SEGMENTS_RELATIVE_DIRECTORY)
+
+    raise ValueError(f'Invalid storage backend: {backend}')
+
+
 def load_tags(session: Session, sql_statement: sqlalchemy.Select) -> List[Dict[str, Dict[str, int]]]:    
     
     '''Loads tags based on specified SQL statement and specified session.
@@ -0,0 +1,85 @@
+import argparse
+import os
+import sqlalchemy
+
+from sqlalchemy.orm import Session, sessionmaker
+
+import sys
+
+WORKING_DIR: str = os.getcwd()
+
+if WORKING_DIR not in sys.path:
+    sys.path.append(WORKING_DIR)
+
+from database.models import Tags
+from database.storage import Storage
+from database.utils import db_connect, storage_connect
+from misc.utils import initialize_logger
+
+
+SCRIPT_NAME: str = os.path.split(__file__)[1]
+
+# Whole time range of the samples
+MIN_TIMESTAMP: str = '0001-01-01T00:00:00'
+MAX_TIMESTAMP: str = '9999-12-31T23:59:59'
+
+
+def copy_samples(session: Session, source: Storage, target: Storage, batch_size: int = 100000) -> int:
+
+    '''Copies all the samples from a storage to another, in batches of sequence numbers.
+
+    Arguments:
+     - session (sqlalchemy.orm.Session): session in which execute the SQL queries
+     - source (Storage): storage to read the samples from
+     - target (Storage): storage to write the samples to
+     - batch_size (int): range of sequence numbers copied at every step
+
+    Returns:
+     - 'int' number of copied samples
+    '''
+
+    tag_ids = {tag.name: tag.id for tag in session.execute(sqlalchemy.select(Tags.id, Tags.name))}
+
+    copied_samples: int = 0
+    high_water_mark = source.high_water_mark()
+
+    for after in range(0, high_water_mark, batch_size):
+        samples = source.read_range(MIN_TIMESTAMP, MAX_TIMESTAMP, after=after, upto=after + batch_size)
+
+        copied_samples += target.append_samples([(sample.timestamp, sample.value, tag_ids[sample.name], sample.quality)
+                                                 for sample in samples])
+        target.commit()
+
+    return copied_samples
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Copies the tags\' values from a storage backend to another')
+    parser.add_argument('source', choices=['sqlite', 'segments'], help='storage to read the values from')
+    parser.add_argument('target', choices=['sqlite', 'segments'], help='storage to write the values to')
+    args = parser.parse_args()
+
+    logger = initialize_logger(SCRIPT_NAME)
+
+    if args.source == args.target:
+        logger.error('Source and target storage must be different')
+        sys.exit(1)
+
+    engine = db_connect(create_metadata=True, echo=False)
+    Session = sessionmaker(bind=engine)
+
+    with Session() as session:
+        source = storage_connect(session, args.source)
+        target = storage_connect(session, args.target)
+
+        copied_samples = copy_samples(session, source, target)
+
+        source.close()
+        target.close()
+
+    logger.info(f'{copied_samples} samples copied from {args.source} to {args.target}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+import argparse
+import os
+import re
+import subprocess
+
+import sys
+
+WORKING_DIR: str = os.getcwd()
+
+if WORKING_DIR not in sys.path:
+    sys.path.append(WORKING_DIR)
+
+
+# Entry points and the heavy modules they must not import at startup (they are loaded on first use)
+ENTRY_POINTS: dict = {
+    'api.main': ['matplotlib', 'numpy', 'snap7'],
+    'collector.client': ['matplotlib', 'numpy', 'snap7'],
+}
+
+# Output format of 'python -X importtime': 'import time: self [us] | cumulative | imported package'
+IMPORT_TIME_PATTERN: str = r'^import time:\s+(?P<self>\d+) \|\s+(?P<cumulative>\d+) \| (?P<indent>\s*)(?P<module>\S+)$'
+
+
+def measure_import_time(module: str) -> list:
+
+    '''Imports the specified module in a new interpreter and collects its import-time breakdown.
+
+    Arguments:
+     - module (str): name of the module to be imported
+
+    Returns:
+     - 'list(tuple(module, self_us, cumulative_us, level))' in case of success
+    '''
+
+    process = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                             cwd=WORKING_DIR, capture_output=True, text=True)
+
+    if process.returncode != 0:
+        raise RuntimeError(f'Import of {module} failed:\n{process.stderr}')
+
+    imports: list = []
+
+    for line in process.stderr.splitlines():
+        match = re.search(IMPORT_TIME_PATTERN, line)
+        if match is not None:
+            imports.append((match['module'], int(match['self']), int(match['cumulative']),
+                            len(match['indent']) // 2))
+
+    return imports
+
+
+def startup_report(module: str, forbidden_modules: list, top: int = 10, budget: float | None = None) -> bool:
+
+    '''Prints the import-time breakdown of the specified entry point.
+
+    Arguments:
+     - module (str): name of the entry point module
+     - forbidden_modules (list): heavy modules which must not be imported at startup
+     - top (int): number of slowest top-level imports to be printed
+     - budget (float): maximum import time (ms) of the entry point
+
+    Returns:
+     - 'True' if no forbidden module has been imported and the budget is respected
+     - 'False' otherwise
+    '''
+
+    imports = measure_import_time(module)
+
+    success: bool = True
+    total_us = sum(self_us for _, self_us, _, _ in imports)
+    top_level = sorted((i for i in imports if i[3] <= 1 and i[0] != module), key=lambda i: i[2], reverse=True)
+
+    print(f'{module}: {total_us / 1000:.1f} ms, {len(imports)} modules')
+
+    for name, _, cumulative_us, _ in top_level[:top]:
+        print(f'  {cumulative_us / 1000:>9.1f} ms  {name}')
+
+    eager_modules = sorted({name.split('.')[0] for name, _, _, _ in imports} & set(forbidden_modules))
+    if len(eager_modules) > 0:
+        print(f'  ERROR: heavy modules imported at startup: {", ".join(eager_modules)}')
+        success = False
+
+    if budget is not None and total_us / 1000 > budget:
+        print(f'  ERROR: {total_us / 1000:.1f} ms exceeds the budget of {budget:.1f} ms')
+        success = False
+
+    return success
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Import-time report of the API and collector entry points')
+    parser.add_argument('--top', type=int, default=10, help='number of slowest imports to be printed')
+    parser.add_argument('--budget', type=float, default=None,
+                        help='maximum import time (ms) of every entry point')
+    args = parser.parse_args()
+
+    success: bool = True
+
+    for module, forbidden_modules in ENTRY_POINTS.items():
+        success &= startup_report(module, forbidden_modules, args.top, args.budget)
+
+    sys.exit(0 if success else 1)
+
+
+if __name__ == '__main__':
+    main()
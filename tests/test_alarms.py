@@ -0,0 +1,181 @@
+import os
+import sqlalchemy
+import unittest
+
+import sys
+
+WORKING_DIR: str = os.getcwd()
+
+if WORKING_DIR not in sys.path:
+    sys.path.append(WORKING_DIR)
+
+from collector.alarms import AlarmEngine, ALARM_DEADBAND, ALARM_ON_DELAY
+from database.models import AlarmEvents, Tags, QUALITY_GOOD
+from database.storage import SQLiteStorage
+from tests.test_storage import create_test_session
+
+
+# Setpoint tags added to the test DB (SYSTEM1-PROBE1-SET-HH is tag 2): (id, name)
+TEST_SETPOINT_TAGS: list = [(4, 'SYSTEM1-PROBE1-SET-H'), (5, 'SYSTEM1-PROBE1-SET-L'), (6, 'SYSTEM1-PROBE1-SET-LL')]
+
+PV_TAG_ID: int = 1
+SET_HH_TAG_ID: int = 2
+SET_LL_TAG_ID: int = 6
+OTHER_PV_TAG_ID: int = 3
+
+
+def sample(timestamp: str, value: float | None, tag_id: int, quality: int = QUALITY_GOOD) -> dict:
+    return {'timestamp': timestamp, 'value': value, 'tag_id': tag_id, 'quality': quality}
+
+
+def at(seconds: int) -> str:
+    # Timestamp of the test samples, in seconds from 2023-08-06T10:00:00
+    return f'2023-08-06T{10 + seconds // 3600:02d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}'
+
+
+class TestAlarmEngine(unittest.TestCase):
+    '''Alarms raised and cleared by the engine on the SET-HH/H/L/LL setpoints of the PV tags'''
+
+    def setUp(self):
+        self.session = create_test_session()
+        self.session.add_all([Tags(id=tag_id, name=name, description=name, address='DB1@0->4',
+                                   collection_interval='5 min', low_limit=0.0, high_limit=100.0, egu='°C')
+                              for tag_id, name in TEST_SETPOINT_TAGS])
+        self.session.commit()
+
+        self.storage = SQLiteStorage(self.session)
+
+        # SET-HH = 50, SET-H = 40, SET-L = 10, SET-LL = 0
+        self.storage.append_samples([(at(0), value, tag_id, QUALITY_GOOD)
+                                     for tag_id, value in ((2, 50.0), (4, 40.0), (5, 10.0), (6, 0.0))])
+        self.storage.commit()
+
+        self.engine = self.load_engine()
+
+    def tearDown(self):
+        self.session.close()
+
+    def load_engine(self) -> AlarmEngine:
+        engine = AlarmEngine()
+        engine.load(self.session, self.storage)
+        return engine
+
+    def evaluate(self, *records: dict, engine: AlarmEngine | None = None) -> int:
+        events_count = (engine or self.engine).evaluate(self.session, list(records))
+        self.session.commit()
+        return events_count
+
+    def events(self, alarm_type: str | None = None) -> list:
+        sql_statement = sqlalchemy.select(AlarmEvents).order_by(AlarmEvents.id)
+        if alarm_type is not None:
+            sql_statement = sql_statement.where(AlarmEvents.alarm_type == alarm_type)
+
+        return [(event.alarm_type, event.start_time, event.end_time, event.peak_value)
+                for event in self.session.scalars(sql_statement)]
+
+    def test_on_delay(self):
+        self.evaluate(sample(at(60), 45.0, PV_TAG_ID))
+        self.evaluate(sample(at(60 + ALARM_ON_DELAY - 1), 45.0, PV_TAG_ID))
+        self.assertEqual(self.events(), [])
+
+        # The alarm starts when the violation began, once it lasted the on-delay
+        self.assertEqual(self.evaluate(sample(at(60 + ALARM_ON_DELAY), 45.0, PV_TAG_ID)), 1)
+        self.assertEqual(self.events(), [('H', at(60), None, 45.0)])
+
+    def test_short_violation(self):
+        self.evaluate(sample(at(60), 45.0, PV_TAG_ID))
+        self.evaluate(sample(at(90), 35.0, PV_TAG_ID))
+        self.evaluate(sample(at(60 + ALARM_ON_DELAY), 45.0, PV_TAG_ID))
+
+        # The violation restarted: the on-delay is counted again
+        self.assertEqual(self.events(), [])
+
+    def test_deadband(self):
+        self.evaluate(sample(at(60), 55.0, PV_TAG_ID))
+        self.evaluate(sample(at(120), 55.0, PV_TAG_ID))
+        self.assertEqual([event[0] for event in self.events()], ['HH', 'H'])
+
+        # Back below the setpoint, but within the deadband
+        self.evaluate(sample(at(180), 50.0 - ALARM_DEADBAND, PV_TAG_ID))
+        self.assertEqual(self.events('HH'), [('HH', at(60), None, 55.0)])
+
+        self.assertEqual(self.evaluate(sample(at(240), 50.0 - ALARM_DEADBAND - 0.1, PV_TAG_ID)), 1)
+        self.assertEqual(self.events('HH'), [('HH', at(60), at(240), 55.0)])
+        self.assertEqual(self.events('H'), [('H', at(60), None, 55.0)])
+
+    def test_peaks(self):
+        for seconds, value in ((60, -5.0), (120, -8.0), (180, -12.5), (240, -3.0), (300, 11.0)):
+            self.evaluate(sample(at(seconds), value, PV_TAG_ID))
+
+        # Minimum reached during the low excursions
+        self.assertEqual(self.events('LL'), [('LL', at(60), at(300), -12.5)])
+        self.assertEqual(self.events('L'), [('L', at(60), at(300), -12.5)])
+
+    def test_many_samples_per_tag(self):
+        events_count = self.evaluate(sample(at(60), 52.0, PV_TAG_ID),
+                                     sample(at(120), 58.0, PV_TAG_ID),
+                                     sample(at(120), 58.0, OTHER_PV_TAG_ID),
+                                     sample(at(180), 45.0, PV_TAG_ID),
+                                     sample(at(240), 30.0, PV_TAG_ID))
+
+        # Samples of the same tag are evaluated one after the other, in timestamp order
+        self.assertEqual(events_count, 4)
+        self.assertEqual(self.events(), [('HH', at(60), at(180), 58.0), ('H', at(60), at(240), 58.0)])
+
+    def test_setpoint_changes_in_batch(self):
+        events_count = self.evaluate(sample(at(60), 45.0, PV_TAG_ID),
+                                     sample(at(90), 45.0, SET_HH_TAG_ID),
+                                     sample(at(90), 45.0, PV_TAG_ID),
+                                     sample(at(150), 45.0, PV_TAG_ID))
+
+        # The sample at 60 s is evaluated against the previous SET-HH (50)
+        self.assertEqual(events_count, 2)
+        self.assertEqual(self.events(), [('HH', at(90), None, 45.0), ('H', at(60), None, 45.0)])
+
+    def test_bad_quality(self):
+        self.evaluate(sample(at(60), 45.0, PV_TAG_ID))
+        self.evaluate(sample(at(120), 45.0, PV_TAG_ID))
+
+        # Missed reads (stored without a value, or with the LL setpoint above the PV) are ignored
+        self.assertEqual(self.evaluate(sample(at(180), None, PV_TAG_ID, quality=24),
+                                       sample(at(180), 100.0, SET_LL_TAG_ID, quality=8)), 0)
+
+        self.evaluate(sample(at(240), 30.0, PV_TAG_ID))
+        self.assertEqual(self.events(), [('H', at(60), at(240), 45.0)])
+
+    def test_reload(self):
+        self.evaluate(sample(at(60), 55.0, PV_TAG_ID))
+        self.evaluate(sample(at(120), 57.0, PV_TAG_ID))
+
+        # Collector restarted during the excursion: the open events are resumed, not duplicated
+        engine = self.load_engine()
+        self.assertEqual(self.evaluate(sample(at(180), 56.0, PV_TAG_ID), engine=engine), 0)
+        self.assertEqual(self.evaluate(sample(at(240), 45.0, PV_TAG_ID), engine=engine), 1)
+        self.assertEqual(self.events(), [('HH', at(60), at(240), 57.0), ('H', at(60), None, 57.0)])
+
+    def test_reload_after_outage(self):
+        self.evaluate(sample(at(60), 55.0, PV_TAG_ID))
+        self.evaluate(sample(at(120), 55.0, PV_TAG_ID))
+
+        # Collector restarted after missed reads of the setpoints: their latest good values are loaded
+        self.storage.append_samples([(at(180), 0.0, tag_id, 24) for tag_id in (2, 4, 5, 6)])
+        self.storage.commit()
+
+        engine = self.load_engine()
+        self.assertEqual(engine.setpoints[engine.pv_rows[PV_TAG_ID]].tolist(), [50.0, 40.0, 10.0, 0.0])
+
+        self.assertEqual(self.evaluate(sample(at(240), 45.0, PV_TAG_ID), engine=engine), 1)
+        self.assertEqual(self.events(), [('HH', at(60), at(240), 55.0), ('H', at(60), None, 55.0)])
+
+    def test_unknown_setpoint(self):
+        self.evaluate(sample(at(60), 55.0, PV_TAG_ID))
+        self.evaluate(sample(at(120), 55.0, PV_TAG_ID))
+
+        # An active alarm is not cleared while its setpoint is unknown
+        self.engine.setpoints[:] = float('nan')
+        self.evaluate(sample(at(180), 30.0, PV_TAG_ID))
+        self.assertEqual([event[2] for event in self.events()], [None, None])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,145 @@
+import os
+import unittest
+
+from unittest.mock import patch
+
+import sys
+
+WORKING_DIR: str = os.getcwd()
+
+if WORKING_DIR not in sys.path:
+    sys.path.append(WORKING_DIR)
+
+from api.cache import DataCache, estimate_size
+from database.models import QUALITY_GOOD
+from database.storage import SQLiteStorage
+from tests.test_storage import create_test_session
+
+import api.dto
+
+
+PV_TAG_ID: int = 1
+OTHER_PV_TAG_ID: int = 3
+
+
+def at(minutes: int) -> str:
+    # Timestamp of the test samples, in minutes from 2023-08-06T10:00:00
+    return f'2023-08-06T{10 + minutes // 60:02d}:{minutes % 60:02d}:00'
+
+
+class TestDataCache(unittest.TestCase):
+    '''Relative-period queries served by the cache match the storage, reading only the new values'''
+
+    def setUp(self):
+        self.session = create_test_session()
+        self.storage = SQLiteStorage(self.session)
+        self.cache = DataCache()
+
+        # Window of the 'last_1_hour' period, moved by the tests
+        self.window = (at(0), at(60))
+        self.calculate_period = patch('api.cache.calculate_period', side_effect=lambda period: self.window)
+        self.calculate_period.start()
+
+    def tearDown(self):
+        self.calculate_period.stop()
+        self.session.close()
+
+    def append(self, *samples: tuple):
+        self.storage.append_samples([(timestamp, value, tag_id, QUALITY_GOOD) for timestamp, value, tag_id in samples])
+        self.storage.commit()
+
+    def get_data(self, name_like: str = '%', period: str = 'last_1_hour') -> list:
+        return [(data.name, data.timestamp, data.value) for data in self.cache.get_data(self.storage, name_like, period)]
+
+    def read_range(self, name_like: str = '%') -> list:
+        return [(sample.name, sample.timestamp, sample.value)
+                for sample in self.storage.read_range(*self.window, name_like)]
+
+    def test_increments(self):
+        self.append((at(10), 1.0, PV_TAG_ID), (at(20), 2.0, PV_TAG_ID))
+        self.assertEqual(self.get_data(), self.read_range())
+
+        self.append((at(30), 3.0, PV_TAG_ID), (at(30), 4.0, OTHER_PV_TAG_ID))
+
+        # Only the values stored after the previous call are read
+        with patch.object(self.storage, 'read_range', wraps=self.storage.read_range) as read_range:
+            data = self.get_data()
+
+        self.assertEqual(read_range.call_args.kwargs['after'], 2)
+        self.assertEqual(data, self.read_range())
+        self.assertEqual(len(data), 4)
+
+        # Nothing new: the storage is not read
+        with patch.object(self.storage, 'read_range', wraps=self.storage.read_range) as read_range:
+            self.assertEqual(self.get_data(), data)
+
+        read_range.assert_not_called()
+
+    def test_late_values(self):
+        self.append((at(30), 1.0, PV_TAG_ID))
+        self.get_data()
+
+        # Values stored with a timestamp older than the cached ones are sorted in the window
+        self.append((at(10), 2.0, PV_TAG_ID), (at(40), 3.0, PV_TAG_ID))
+        self.assertEqual([timestamp for _, timestamp, _ in self.get_data()], [at(10), at(30), at(40)])
+
+    def test_window_eviction(self):
+        self.append((at(10), 1.0, PV_TAG_ID), (at(50), 2.0, PV_TAG_ID))
+        self.get_data()
+
+        self.window = (at(30), at(90))
+        self.append((at(80), 3.0, PV_TAG_ID))
+
+        self.assertEqual(self.get_data(), self.read_range())
+        self.assertEqual([value for _, _, value in self.get_data()], [2.0, 3.0])
+
+    def test_values_after_end_time(self):
+        self.append((at(10), 1.0, PV_TAG_ID), (at(61), 2.0, PV_TAG_ID))
+
+        # A value stamped after the end of the window (e.g. clock skew) is returned once it falls in it
+        self.assertEqual([value for _, _, value in self.get_data()], [1.0])
+
+        self.window = (at(2), at(62))
+        self.assertEqual([value for _, _, value in self.get_data()], [1.0, 2.0])
+        self.assertEqual(self.get_data(), self.read_range())
+
+    def test_queries(self):
+        self.append((at(10), 1.0, PV_TAG_ID), (at(10), 2.0, OTHER_PV_TAG_ID))
+
+        # Every (name_like, period) query has its own entry
+        self.assertEqual(self.get_data('SYSTEM1%'), self.read_range('SYSTEM1%'))
+        self.assertEqual(self.get_data('SYSTEM2%'), self.read_range('SYSTEM2%'))
+        self.assertEqual(list(self.cache.entries.keys()), [('SYSTEM1%', 'last_1_hour'), ('SYSTEM2%', 'last_1_hour')])
+
+    def test_lru_eviction(self):
+        self.append((at(10), 1.0, PV_TAG_ID), (at(10), 2.0, OTHER_PV_TAG_ID))
+
+        # Budget of two entries of one value
+        value_size = estimate_size(api.dto.Data(name='SYSTEM1-PROBE1-PV', timestamp=at(10), value=1.0))
+        self.cache.max_size = 2 * value_size
+
+        self.get_data('SYSTEM1%')
+        self.get_data('SYSTEM2%')
+        self.get_data('SYSTEM1%')
+        self.get_data('SYSTEM1-PROBE1-PV')
+
+        # The least recently used entry is evicted to fit the budget
+        self.assertEqual(list(self.cache.entries.keys()), [('SYSTEM1%', 'last_1_hour'),
+                                                          ('SYSTEM1-PROBE1-PV', 'last_1_hour')])
+        self.assertLessEqual(self.cache.size, self.cache.max_size)
+
+        # An entry larger than the budget is not cached, but still returned
+        self.cache.max_size = value_size
+        self.assertEqual(len(self.get_data('%')), 2)
+        self.assertNotIn(('%', 'last_1_hour'), self.cache.entries)
+
+    def test_clear(self):
+        self.append((at(10), 1.0, PV_TAG_ID))
+        self.get_data()
+        self.cache.clear()
+
+        self.assertEqual((len(self.cache.entries), self.cache.size), (0, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,145 @@
+import os
+import struct
+import unittest
+
+from unittest.mock import patch
+
+import sys
+
+WORKING_DIR: str = os.getcwd()
+
+if WORKING_DIR not in sys.path:
+    sys.path.append(WORKING_DIR)
+
+from snap7.error import S7ConnectionError, S7ProtocolError, S7TimeoutError
+
+from collector.connection import PLCConnection, RECONNECT_BACKOFF_MIN, RECONNECT_BACKOFF_MAX
+from collector.utils import read_data_from_plc
+from database.models import QUALITY_GOOD, QUALITY_BAD_COMM_FAILURE, QUALITY_BAD_CONFIG_ERROR, QUALITY_BAD_NOT_CONNECTED
+
+
+# Tags read by the tests: {tag_id: {db_number, start, size}}
+TEST_TAGS: list = [{1: {'db_number': 1, 'start': 0, 'size': 4}}, {2: {'db_number': 1, 'start': 4, 'size': 4}}]
+
+
+class FakeClient:
+    '''snap7 client of a PLC which answers every read with 21.5, or raises the given error'''
+
+    def __init__(self):
+        self.connected: bool = False
+        self.error: Exception | None = None
+        self.reads: int = 0
+
+    def set_param(self, parameter, value: int):
+        pass
+
+    def connect(self, address: str, rack: int, slot: int, tcp_port: int):
+        self.connected = True
+
+    def get_connected(self) -> bool:
+        return self.connected
+
+    def db_read(self, db_number: int, start: int, size: int) -> bytearray:
+        self.reads += 1
+        if self.error is not None:
+            raise self.error
+
+        return bytearray(struct.pack('>f', 21.5))
+
+    def disconnect(self):
+        self.connected = False
+
+    def destroy(self):
+        pass
+
+
+class TestPLCConnection(unittest.TestCase):
+    '''The link is reset (and reconnected with backoff) only on link errors, reads never wait for it'''
+
+    def setUp(self):
+        self.client_class = patch('snap7.client.Client', FakeClient)
+        self.client_class.start()
+
+        # Reconnections are checked by test_backoff: no background thread is started
+        self.start_reconnect = patch.object(PLCConnection, '_start_reconnect')
+        self.start_reconnect.start()
+
+        self.connection = PLCConnection('127.0.0.1')
+        self.assertTrue(self.connection.open())
+
+    def tearDown(self):
+        self.start_reconnect.stop()
+        self.client_class.stop()
+
+    def test_good_read(self):
+        self.assertEqual(self.connection.db_read(1, 0, 4), (bytearray(struct.pack('>f', 21.5)), QUALITY_GOOD))
+
+    def test_link_errors(self):
+        for error in (S7ConnectionError('connection reset'), S7TimeoutError('receive timeout'), OSError('broken pipe')):
+            with self.subTest(type(error).__name__):
+                self.assertTrue(self.connection.open())
+                self.connection.client.error = error
+                PLCConnection._start_reconnect.reset_mock()
+
+                self.assertEqual(self.connection.db_read(1, 0, 4), (None, QUALITY_BAD_COMM_FAILURE))
+                self.assertFalse(self.connection.connected)
+                self.assertFalse(self.connection.client.connected)
+                PLCConnection._start_reconnect.assert_called_once()
+
+                # The next reads don't wait for the link
+                reads = self.connection.client.reads
+                self.assertEqual(self.connection.db_read(1, 0, 4), (None, QUALITY_BAD_NOT_CONNECTED))
+                self.assertEqual(self.connection.client.reads, reads)
+
+    def test_item_error(self):
+        self.connection.client.error = S7ProtocolError('address out of range')
+
+        # Only the read is bad: the link is kept
+        self.assertEqual(self.connection.db_read(99, 0, 4), (None, QUALITY_BAD_CONFIG_ERROR))
+        self.assertTrue(self.connection.connected)
+        self.assertTrue(self.connection.client.connected)
+        PLCConnection._start_reconnect.assert_not_called()
+
+        self.connection.client.error = None
+        self.assertEqual(self.connection.db_read(1, 0, 4)[1], QUALITY_GOOD)
+
+    def test_backoff(self):
+        waits: list = []
+        attempts: int = 12
+
+        # The PLC answers at the last attempt
+        def connect() -> bool:
+            return len(waits) == attempts
+
+        with patch.object(self.connection.stop_event, 'wait', side_effect=lambda timeout: waits.append(timeout) or False), \
+             patch.object(self.connection, '_connect', side_effect=connect):
+            self.connection._reconnect()
+
+        # Doubled at every failed attempt, up to the maximum
+        expected_waits = [min(RECONNECT_BACKOFF_MIN * 2 ** i, RECONNECT_BACKOFF_MAX) for i in range(attempts)]
+        self.assertEqual(waits, expected_waits)
+        self.assertEqual(waits[-1], RECONNECT_BACKOFF_MAX)
+
+    def test_backoff_stopped(self):
+        with patch.object(self.connection, '_connect', return_value=False) as connect:
+            self.connection.stop_event.set()
+            self.connection._reconnect()
+
+        connect.assert_not_called()
+
+    def test_scan_budget(self):
+        data = read_data_from_plc(self.connection, TEST_TAGS)
+        self.assertEqual([(value, tag_id, quality) for _, value, tag_id, quality in data],
+                         [(21.5, 1, QUALITY_GOOD), (21.5, 2, QUALITY_GOOD)])
+
+        # Scan budget expired: the tags not read yet are missed, without reading them
+        reads = self.connection.client.reads
+        data = read_data_from_plc(self.connection, TEST_TAGS, scan_budget=0.0)
+
+        self.assertEqual([(value, tag_id, quality) for _, value, tag_id, quality in data],
+                         [(None, 1, QUALITY_BAD_COMM_FAILURE), (None, 2, QUALITY_BAD_COMM_FAILURE)])
+        self.assertEqual(self.connection.client.reads, reads)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,179 @@
+import numpy as np
+import os
+import shutil
+import tempfile
+import unittest
+
+import sys
+
+WORKING_DIR: str = os.getcwd()
+
+if WORKING_DIR not in sys.path:
+    sys.path.append(WORKING_DIR)
+
+import database.segments
+
+from database.models import QUALITY_GOOD, QUALITY_BAD_NOT_CONNECTED
+from database.segments import (SegmentStorage, HEAD_RECORD_DTYPE, decode_floats, decode_integers,
+                               encode_floats, encode_integers, to_epoch, to_timestamps)
+from tests.test_storage import create_test_session, MIN_TIMESTAMP, MAX_TIMESTAMP
+
+
+# Samples appended to a head before it is sealed (small, so that the tests seal many segments)
+TEST_SEGMENT_MAX_SAMPLES: int = 10
+
+
+class TestCodecs(unittest.TestCase):
+    '''Encoded blocks are decoded back to the same values'''
+
+    def test_integers_round_trip(self):
+        rng = np.random.default_rng(0)
+        cases = {
+            'regular': np.arange(1691330400, 1691330400 + 60 * 1000, 60, dtype=np.int64),
+            'jitter': np.cumsum(rng.integers(55, 65, 1000)).astype(np.int64),
+            'negative': np.array([-5, -3, 0, 7, -2 ** 40, 2 ** 40], dtype=np.int64),
+            'limits': np.array([np.iinfo(np.int64).min // 4, 0, np.iinfo(np.int64).max // 4], dtype=np.int64),
+            'single': np.array([192], dtype=np.int64),
+            'empty': np.empty(0, dtype=np.int64),
+        }
+
+        for name, values in cases.items():
+            with self.subTest(name):
+                np.testing.assert_array_equal(decode_integers(encode_integers(values)), values)
+
+    def test_floats_round_trip(self):
+        rng = np.random.default_rng(0)
+        cases = {
+            'random': rng.normal(25.0, 10.0, 1000).round(2),
+            'constant': np.full(1000, 12.5),
+            'special': np.array([0.0, -0.0, np.inf, -np.inf, 1e-300, -1e300, np.nan]),
+            'single': np.array([-83.42]),
+            'empty': np.empty(0),
+        }
+
+        for name, values in cases.items():
+            with self.subTest(name):
+                decoded = decode_floats(encode_floats(values))
+
+                # Bit-exact (e.g. -0.0 and NaN are preserved)
+                np.testing.assert_array_equal(decoded.view('<u8'), values.astype('<f8').view('<u8'))
+
+    def test_timestamps_round_trip(self):
+        timestamps = ['1970-01-01T00:00:00', '2023-08-06T14:21:06', '2024-02-29T23:59:59']
+        self.assertEqual(to_timestamps(to_epoch(timestamps)), timestamps)
+
+
+class TestSegmentStorage(unittest.TestCase):
+    '''Heads are sealed in segments at commit, and the writer recovers its state when it restarts'''
+
+    def setUp(self):
+        self.segment_max_samples = database.segments.SEGMENT_MAX_SAMPLES
+        database.segments.SEGMENT_MAX_SAMPLES = TEST_SEGMENT_MAX_SAMPLES
+
+        self.session = create_test_session()
+        self.directory = tempfile.mkdtemp()
+        self.storage = SegmentStorage(self.session, self.directory)
+
+    def tearDown(self):
+        database.segments.SEGMENT_MAX_SAMPLES = self.segment_max_samples
+
+        self.storage.close()
+        self.session.close()
+        shutil.rmtree(self.directory)
+
+    def append(self, storage: SegmentStorage, count: int, first: int = 0, tag_id: int = 1):
+        for i in range(first, first + count):
+            quality = QUALITY_BAD_NOT_CONNECTED if i % 4 == 0 else QUALITY_GOOD
+            storage.append_samples([(f'2023-08-06T10:{i // 60:02d}:{i % 60:02d}', i * 0.5, tag_id, quality)])
+            storage.commit()
+
+    def files(self, tag_id: int = 1) -> list:
+        return sorted(os.listdir(os.path.join(self.directory, str(tag_id))))
+
+    def test_seal(self):
+        self.append(self.storage, 25)
+
+        # Two sealed segments (named after their time and sequence numbers ranges) and the head
+        self.assertEqual(self.files(), ['1691316000_1691316009_1_10.seg', '1691316010_1691316019_11_20.seg',
+                                        'head_21.bin'])
+
+        samples = self.storage.read_range(MIN_TIMESTAMP, MAX_TIMESTAMP)
+        self.assertEqual([sample.value for sample in samples], [i * 0.5 for i in range(25)])
+        self.assertEqual([sample.quality for sample in samples],
+                         [QUALITY_BAD_NOT_CONNECTED if i % 4 == 0 else QUALITY_GOOD for i in range(25)])
+        self.assertEqual(self.storage.high_water_mark(), 25)
+
+    def test_time_range(self):
+        self.append(self.storage, 25)
+
+        samples = self.storage.read_range('2023-08-06T10:00:08', '2023-08-06T10:00:12')
+        self.assertEqual([sample.timestamp for sample in samples],
+                         [f'2023-08-06T10:00:{i:02d}' for i in range(8, 13)])
+
+    def test_incremental_read(self):
+        self.append(self.storage, 25)
+
+        samples = self.storage.read_range(MIN_TIMESTAMP, MAX_TIMESTAMP, after=18, upto=22)
+        self.assertEqual([sample.value for sample in samples], [i * 0.5 for i in range(18, 22)])
+
+    def test_uncommitted_samples(self):
+        self.append(self.storage, 5)
+        self.storage.append_samples([('2023-08-06T11:00:00', 1.0, 1, QUALITY_GOOD)])
+
+        # Readers don't see the samples appended after the last commit
+        reader = SegmentStorage(self.session, self.directory)
+        self.assertEqual(len(reader.read_range(MIN_TIMESTAMP, MAX_TIMESTAMP)), 5)
+
+    def test_recovery(self):
+        self.append(self.storage, 15)
+        self.append(self.storage, 3, tag_id=3)
+        self.storage.close()
+
+        tag_directory = os.path.join(self.directory, '1')
+        head_path = os.path.join(tag_directory, 'head_11.bin')
+
+        # Writer stopped after sealing a segment but before removing its head
+        sealed_records = database.segments.SegmentStorage._read_segment(
+            os.path.join(tag_directory, '1691316000_1691316009_1_10.seg'))
+        with open(os.path.join(tag_directory, 'head_1.bin'), 'wb') as f:
+            f.write(sealed_records.tobytes())
+
+        # Writer stopped while appending a record
+        with open(head_path, 'ab') as f:
+            f.write(b'\x00' * (HEAD_RECORD_DTYPE.itemsize // 2))
+
+        storage = SegmentStorage(self.session, self.directory)
+        self.append(storage, 10, first=15)
+        storage.close()
+
+        # The sealed head is removed, the partial record is dropped and the sequence numbers go on
+        self.assertNotIn('head_1.bin', self.files())
+        self.assertEqual(storage.high_water_mark(), 28)
+
+        samples = storage.read_range(MIN_TIMESTAMP, MAX_TIMESTAMP, tag_names=['SYSTEM1-PROBE1-PV'])
+        self.assertEqual([sample.value for sample in samples], [i * 0.5 for i in range(25)])
+
+    def test_latest_values(self):
+        self.append(self.storage, 20)
+
+        # The head is empty (sealed at the last commit): the latest value comes from the last segment
+        self.assertEqual(self.files(), ['1691316000_1691316009_1_10.seg', '1691316010_1691316019_11_20.seg'])
+
+        samples = self.storage.latest_values(tag_names=['SYSTEM1-PROBE1-PV'])
+        self.assertEqual([(sample.timestamp, sample.value) for sample in samples], [('2023-08-06T10:00:19', 9.5)])
+
+    def test_latest_good_values(self):
+        self.append(self.storage, 21)
+        self.storage.append_samples([(f'2023-08-06T10:00:{i}', 0.0, 1, QUALITY_BAD_NOT_CONNECTED) for i in (21, 22)])
+        self.storage.commit()
+
+        # The head only has missed reads: the latest good value comes from the last segment
+        self.assertEqual(self.files(), ['1691316000_1691316009_1_10.seg', '1691316010_1691316019_11_20.seg',
+                                        'head_21.bin'])
+
+        samples = self.storage.latest_values(tag_names=['SYSTEM1-PROBE1-PV'], good_only=True)
+        self.assertEqual([(sample.timestamp, sample.value) for sample in samples], [('2023-08-06T10:00:19', 9.5)])
+
+
+if __name__ == '__main__':
+    unittest.main()
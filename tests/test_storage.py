@@ -0,0 +1,196 @@
+import os
+import shutil
+import sqlalchemy
+import tempfile
+import unittest
+
+from sqlalchemy.orm import Session
+from unittest.mock import patch
+
+import sys
+
+WORKING_DIR: str = os.getcwd()
+
+if WORKING_DIR not in sys.path:
+    sys.path.append(WORKING_DIR)
+
+from database.models import Base, Tags, QUALITY_GOOD, QUALITY_BAD_COMM_FAILURE
+from database.segments import SegmentStorage
+from database.storage import AGGREGATE_FUNCTIONS, SQLiteStorage
+from database.utils import add_missing_columns, rebuild_nullable_tables
+
+
+# Tags of the test DB: (id, name)
+TEST_TAGS: list = [(1, 'SYSTEM1-PROBE1-PV'), (2, 'SYSTEM1-PROBE1-SET-HH'), (3, 'SYSTEM2-PROBE1-PV')]
+
+# Whole time range of the test samples
+MIN_TIMESTAMP: str = '2023-08-06T00:00:00'
+MAX_TIMESTAMP: str = '2023-08-07T00:00:00'
+
+
+def create_test_session() -> Session:
+
+    '''Creates a session on an in-memory SQLite DB with the test tags.
+
+    Arguments: None
+
+    Returns:
+     - 'sqlalchemy.orm.Session' in case of success
+    '''
+
+    engine = sqlalchemy.create_engine('sqlite://')
+    Base.metadata.create_all(bind=engine)
+
+    session = Session(bind=engine)
+    session.add_all([Tags(id=tag_id, name=name, description=name, address='DB1@0->4', collection_interval='1 min',
+                          low_limit=0.0, high_limit=100.0, egu='°C') for tag_id, name in TEST_TAGS])
+    session.commit()
+
+    return session
+
+
+def create_test_samples() -> list:
+
+    '''Creates the test samples: one per tag every 7 minutes over 10 hours, some with a bad quality (and no value).
+
+    Arguments: None
+
+    Returns:
+     - 'list(tuple(timestamp, value, tag_id, quality))' in case of success
+    '''
+
+    samples: list = []
+
+    for i in range(0, 600, 7):
+        timestamp = f'2023-08-06T{10 + i // 60:02d}:{i % 60:02d}:{i % 13:02d}'
+        for tag_id, _ in TEST_TAGS:
+            quality = QUALITY_BAD_COMM_FAILURE if i % 5 == 0 else QUALITY_GOOD
+            value = None if quality != QUALITY_GOOD and tag_id == 3 else round(tag_id * 10 + (i % 17) * 0.37, 2)
+            samples.append((timestamp, value, tag_id, quality))
+
+    return samples
+
+
+class TestStorageParity(unittest.TestCase):
+    '''The SQLite and the segment storages return the same results for the same samples'''
+
+    def setUp(self):
+        self.session = create_test_session()
+        self.directory = tempfile.mkdtemp()
+
+        self.sqlite_storage = SQLiteStorage(self.session)
+        self.segment_storage = SegmentStorage(self.session, self.directory)
+
+        for storage in (self.sqlite_storage, self.segment_storage):
+            storage.append_samples(create_test_samples())
+            storage.commit()
+
+    def tearDown(self):
+        self.segment_storage.close()
+        self.session.close()
+        shutil.rmtree(self.directory)
+
+    def assertSamplesEqual(self, samples: list, expected_samples: list):
+        self.assertEqual(len(samples), len(expected_samples))
+        for sample, expected_sample in zip(samples, expected_samples):
+            self.assertEqual((sample.name, sample.timestamp, sample.quality),
+                             (expected_sample.name, expected_sample.timestamp, expected_sample.quality))
+            self.assertAlmostEqual(sample.value, expected_sample.value)
+
+    def test_high_water_mark(self):
+        self.assertEqual(self.segment_storage.high_water_mark(), self.sqlite_storage.high_water_mark())
+
+    def test_read_range(self):
+        cases = {
+            'all': {},
+            'name_like': {'name_like': 'SYSTEM1%'},
+            'tag_names': {'tag_names': ['SYSTEM2-PROBE1-PV', 'SYSTEM1-PROBE1-SET-HH']},
+            'incremental': {'after': 40, 'upto': 120},
+        }
+
+        for name, arguments in cases.items():
+            for start_time, end_time in ((MIN_TIMESTAMP, MAX_TIMESTAMP), ('2023-08-06T12:10:00', '2023-08-06T13:00:00')):
+                with self.subTest(name, start_time=start_time):
+                    samples = self.segment_storage.read_range(start_time, end_time, **arguments)
+                    self.assertSamplesEqual(samples, self.sqlite_storage.read_range(start_time, end_time, **arguments))
+
+    def test_latest_values(self):
+        for start_time, end_time in ((None, None), ('2023-08-06T12:10:00', '2023-08-06T13:00:00')):
+            with self.subTest(start_time=start_time):
+                samples = self.segment_storage.latest_values(start_time, end_time)
+                self.assertSamplesEqual(samples, self.sqlite_storage.latest_values(start_time, end_time))
+
+                samples = self.segment_storage.latest_values(start_time, end_time, good_only=True)
+                self.assertSamplesEqual(samples, self.sqlite_storage.latest_values(start_time, end_time, good_only=True))
+                self.assertTrue(all(sample.quality == QUALITY_GOOD for sample in samples))
+
+    def test_aggregate(self):
+        for function in AGGREGATE_FUNCTIONS:
+            for bucket in (60, 3600):
+                with self.subTest(function=function, bucket=bucket):
+                    samples = self.segment_storage.aggregate(MIN_TIMESTAMP, MAX_TIMESTAMP, bucket, function)
+                    self.assertSamplesEqual(samples, self.sqlite_storage.aggregate(MIN_TIMESTAMP, MAX_TIMESTAMP,
+                                                                                   bucket, function))
+
+    def test_aggregate_buckets(self):
+        samples = self.sqlite_storage.aggregate(MIN_TIMESTAMP, MAX_TIMESTAMP, 3600, 'count',
+                                                tag_names=['SYSTEM1-PROBE1-PV'])
+
+        # 10 hourly buckets, starting at the hour, counting only the good samples
+        self.assertEqual([sample.timestamp for sample in samples],
+                         [f'2023-08-06T{hour:02d}:00:00' for hour in range(10, 20)])
+        self.assertEqual(sum(sample.value for sample in samples),
+                         sum(1 for _, _, tag_id, quality in create_test_samples()
+                             if tag_id == 1 and quality == QUALITY_GOOD))
+
+
+class TestMigrations(unittest.TestCase):
+    '''DBs created by older versions are migrated to the current models, keeping their rows'''
+
+    def test_migrate_data_table(self):
+        engine = sqlalchemy.create_engine('sqlite://')
+
+        # data table without the quality column and with a NOT NULL value
+        with engine.begin() as connection:
+            connection.execute(sqlalchemy.text('CREATE TABLE data (id INTEGER NOT NULL PRIMARY KEY, timestamp VARCHAR NOT NULL, '
+                                               'value FLOAT NOT NULL, tag_id INTEGER)'))
+            connection.execute(sqlalchemy.text("INSERT INTO data VALUES (1, '2023-08-06T10:00:00', 12.5, 1)"))
+
+        Base.metadata.create_all(bind=engine)
+        add_missing_columns(engine)
+        rebuild_nullable_tables(engine)
+
+        columns = {column['name']: column for column in sqlalchemy.inspect(engine).get_columns('data')}
+        self.assertTrue(columns['value']['nullable'])
+
+        session = Session(bind=engine)
+        storage = SQLiteStorage(session)
+        storage.append_samples([('2023-08-06T10:01:00', None, 1, QUALITY_BAD_COMM_FAILURE)])
+        storage.commit()
+
+        self.assertEqual(session.execute(sqlalchemy.text('SELECT id, value, quality FROM data ORDER BY id')).all(),
+                         [(1, 12.5, QUALITY_GOOD), (2, None, QUALITY_BAD_COMM_FAILURE)])
+        session.close()
+
+    def test_column_added_concurrently(self):
+        engine = sqlalchemy.create_engine('sqlite://')
+
+        with engine.begin() as connection:
+            connection.execute(sqlalchemy.text('CREATE TABLE data (id INTEGER NOT NULL PRIMARY KEY, timestamp VARCHAR NOT NULL, '
+                                               'value FLOAT, tag_id INTEGER)'))
+
+        Base.metadata.create_all(bind=engine)
+
+        # Columns inspected before another process added the quality column
+        inspector = sqlalchemy.inspect(engine)
+        inspector.get_columns('data')
+        add_missing_columns(engine)
+
+        with patch('sqlalchemy.inspect', return_value=inspector):
+            add_missing_columns(engine)
+
+        self.assertIn('quality', {column['name'] for column in sqlalchemy.inspect(engine).get_columns('data')})
+
+
+if __name__ == '__main__':
+    unittest.main()